@@ -0,0 +1,613 @@
+import sys, time, json, platform, argparse, threading, shutil, subprocess
+import numpy as np
+import importlib.metadata
+import npy_append_array
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from pathlib import Path
+from npy_append_array import NpyAppendArray, HeaderPolicy
+from npy_append_array import NpyAppendCompressedArray, AppendStats
+from npy_append_array import NpyAppendArrayPool
+
+tmpfile = Path('./tmp/bench.npy')
+tmpfile.parent.mkdir(exist_ok=True)
+
+# one record per report call, written with --json
+results = []
+current_benchmark = None
+
+def report(name, nbytes, seconds, **params):
+    # params identify a point of a sweep, so that runs can be compared
+    results.append({
+        "benchmark": current_benchmark, "name": name, "params": params,
+        "bytes": nbytes, "seconds": seconds,
+        "mib_per_s": nbytes / seconds / 1024**2,
+    })
+    print("{:<48} {:>10.1f} MiB/s".format(
+        name, nbytes / seconds / 1024**2
+    ))
+
+def best_of(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# zero-copy append vs. the previous astype + flatten + tofile path
+def bench_append_copy(append_count=16, rows=1024**2 // 8, fortran_order=False):
+    order = 'F' if fortran_order else 'C'
+    shape = (8, rows) if fortran_order else (rows, 8)
+    arr = np.ones(shape, dtype=np.float64, order=order)
+    nbytes = arr.nbytes * append_count
+
+    def run_npaa():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            for _ in range(append_count):
+                npaa.append(arr)
+
+    def run_flatten():
+        with open(tmpfile, 'wb') as fp:
+            for _ in range(append_count):
+                arr.astype(arr.dtype, copy=False).flatten(
+                    order=order
+                ).tofile(fp)
+
+    report("append {} (flatten)".format(order), nbytes, best_of(run_flatten))
+    report("append {} (zero-copy)".format(order), nbytes, best_of(run_npaa))
+
+# appends to many different files from a thread pool, once with one lock per
+# file and once with a single lock shared by all files
+def bench_multi_file(file_count=32, thread_count=8, append_count=16):
+    arr = np.ones((1024**2 // 8 // 8, 8), dtype=np.float64)
+    nbytes = arr.nbytes * append_count * file_count
+    filenames = [
+        tmpfile.with_name('bench_{}.npy'.format(i)) for i in range(file_count)
+    ]
+
+    def run(shared_lock):
+        lock = threading.Lock() if shared_lock else None
+        npaas = [
+            NpyAppendArray(filename, delete_if_exists=True, lock=lock)
+            for filename in filenames
+        ]
+
+        def task(npaa):
+            for _ in range(append_count):
+                npaa.append(arr)
+
+        with ThreadPoolExecutor(thread_count) as executor:
+            list(executor.map(task, npaas))
+
+        for npaa in npaas:
+            npaa.close()
+
+    for shared_lock in [True, False]:
+        report("{} files, {} threads, {} lock".format(
+            file_count, thread_count, "shared" if shared_lock else "per-file"
+        ), nbytes, best_of(lambda: run(shared_lock)))
+
+    for filename in filenames:
+        filename.unlink(missing_ok=True)
+
+# many small appends with and without a staging buffer
+def bench_small_appends(append_count=20000, rows=10, buffer_bytes=4 * 1024**2):
+    arr = np.ones((rows, 4), dtype=np.float32)
+    nbytes = arr.nbytes * append_count
+
+    def run(buffer_bytes):
+        with NpyAppendArray(
+            tmpfile, delete_if_exists=True, buffer_bytes=buffer_bytes
+        ) as npaa:
+            for _ in range(append_count):
+                npaa.append(arr)
+
+    for size in [None, buffer_bytes]:
+        report("{} rows/append, buffer_bytes={}".format(rows, size),
+            nbytes, best_of(lambda: run(size)))
+
+# a batch of arrays appended one by one vs. with a single extend call
+def bench_extend(batch_size=500, rows=100):
+    arrs = [np.ones((rows, 16), dtype=np.float64) for _ in range(batch_size)]
+    nbytes = sum(arr.nbytes for arr in arrs)
+
+    def run_append():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            for arr in arrs:
+                npaa.append(arr)
+
+    def run_extend():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            npaa.extend(arrs)
+
+    report("{} x {} rows (append)".format(batch_size, rows),
+        nbytes, best_of(run_append))
+    report("{} x {} rows (extend)".format(batch_size, rows),
+        nbytes, best_of(run_extend))
+
+# header rewrite and sync policies, from never to durable on every append
+def bench_header_policy(append_count=2000, rows=100, thread_count=4):
+    arr = np.ones((rows, 16), dtype=np.float64)
+    nbytes = arr.nbytes * append_count
+    policies = {
+        "on close": HeaderPolicy(every_appends=None),
+        "every append": HeaderPolicy(),
+        "every 100 appends": HeaderPolicy(every_appends=100),
+        "every 0.1 s": HeaderPolicy(every_seconds=0.1),
+        "every 4 MiB": HeaderPolicy(every_bytes=4*1024**2),
+        "every append, fdatasync": HeaderPolicy(sync="fdatasync"),
+        "every 100 appends, fdatasync": HeaderPolicy(
+            every_appends=100, sync="fdatasync"
+        ),
+    }
+
+    def run(policy):
+        with NpyAppendArray(
+            tmpfile, delete_if_exists=True, header_policy=policy
+        ) as npaa:
+            def task():
+                for _ in range(append_count // thread_count):
+                    npaa.append(arr)
+
+            with ThreadPoolExecutor(thread_count) as executor:
+                for future in [
+                    executor.submit(task) for _ in range(thread_count)
+                ]:
+                    future.result()
+
+    for name, policy in policies.items():
+        report("header {} ({} threads)".format(name, thread_count),
+            nbytes, best_of(lambda: run(policy)))
+
+# many appends with and without preallocating disk space
+def bench_preallocate(append_count=5000, rows=100, preallocate=64 * 1024**2):
+    arr = np.ones((rows, 16), dtype=np.float32)
+    nbytes = arr.nbytes * append_count
+
+    def run(preallocate):
+        with NpyAppendArray(
+            tmpfile, delete_if_exists=True, preallocate=preallocate
+        ) as npaa:
+            for _ in range(append_count):
+                npaa.append(arr)
+
+    for size in [None, preallocate]:
+        report("{} rows/append, preallocate={}".format(rows, size),
+            nbytes, best_of(lambda: run(size)))
+
+# rows filled in place through reserve vs. appended as temporary arrays
+def bench_reserve(append_count=20000, rows=10):
+    nbytes = rows * 16 * 4 * append_count
+
+    def run_append():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            npaa.append(np.zeros((0, 16), dtype=np.float32))
+            for i in range(append_count):
+                npaa.append(np.full((rows, 16), i, dtype=np.float32))
+
+    def run_reserve():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            npaa.append(np.zeros((0, 16), dtype=np.float32))
+            for i in range(append_count):
+                npaa.reserve(rows)[...] = i
+
+    report("{} rows/append (append)".format(rows), nbytes, best_of(run_append))
+    report("{} rows/append (reserve)".format(rows),
+        nbytes, best_of(run_reserve))
+
+# writes a header without spare space, like old Numpy versions did, returns
+# False if the header happens to have enough padding to be appendable anyway
+def save_non_appendable(filename, arr):
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+        np.lib.format.dtype_to_descr(arr.dtype), arr.shape
+    )
+    header += " " * (-(10 + len(header) + 1) % 64) + "\n"
+
+    with open(filename, 'wb') as fp:
+        fp.write(b'\x93NUMPY\x01\x00')
+        fp.write(len(header).to_bytes(2, 'little'))
+        fp.write(header.encode('latin1'))
+        arr.tofile(fp)
+
+    return not npy_append_array.is_appendable(filename)
+
+# ensure_appendable in place and via a copy, against a copy through Python
+def bench_ensure_appendable(size=512 * 1024**2):
+    source = tmpfile.with_name('bench_legacy.npy')
+
+    # the padding of the header depends on the shape
+    for columns in range(16, 80):
+        arr = np.ones((size // 8 // columns, columns), dtype=np.float64)
+        if save_non_appendable(source, arr):
+            break
+
+    def run_python_copy():
+        with open(source, 'rb') as fp, open(tmpfile, 'wb') as fp2:
+            shutil.copyfileobj(fp, fp2, 16 * 1024**2)
+
+    def run(inplace):
+        shutil.copy(source, tmpfile)
+        start = time.perf_counter()
+        npy_append_array.ensure_appendable(tmpfile, inplace=inplace)
+        return time.perf_counter() - start
+
+    report("copy through Python (reference)",
+        arr.nbytes, best_of(run_python_copy))
+    for inplace in [False, True]:
+        report("ensure_appendable inplace={}".format(inplace),
+            arr.nbytes, min(run(inplace) for _ in range(3)))
+
+    source.unlink()
+
+# several processes appending to one file
+def bench_multiprocess(process_count=4, append_count=200, rows=1024):
+    arr = np.ones((rows, 64), dtype=np.float64)
+    nbytes = arr.nbytes * append_count * process_count
+    worker = (
+        "import sys, numpy as np\n"
+        "from npy_append_array import NpyAppendArray\n"
+        "arr = np.ones(({}, 64))\n"
+        "with NpyAppendArray(sys.argv[1], multiprocess=True) as npaa:\n"
+        "    for _ in range({}):\n"
+        "        npaa.append(arr)\n"
+    ).format(rows, append_count)
+
+    def run():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            npaa.append(arr[:0])
+        processes = [
+            subprocess.Popen([sys.executable, '-c', worker, str(tmpfile)])
+            for _ in range(process_count)
+        ]
+        for process in processes:
+            process.wait()
+
+    report("{} processes, multiprocess=True".format(process_count),
+        nbytes, best_of(run))
+
+    Path(str(tmpfile) + '.reservations').unlink(missing_ok=True)
+
+# compressed appends with one compression thread vs. a pool of threads
+def bench_compressed(append_count=64, rows=65536, thread_count=8):
+    # compressible, but not trivially so
+    arr = np.random.default_rng(0).integers(
+        0, 256, (rows, 16), dtype=np.uint8
+    ).astype(np.float32)
+    nbytes = arr.nbytes * append_count
+    filename = tmpfile.with_name('bench.npyc')
+
+    def run(max_workers):
+        with NpyAppendCompressedArray(
+            filename, delete_if_exists=True, max_workers=max_workers
+        ) as npca:
+            for _ in range(append_count):
+                npca.append(arr)
+
+    for max_workers in [1, thread_count]:
+        report("compressed zlib, max_workers={}".format(max_workers),
+            nbytes, best_of(lambda: run(max_workers)))
+
+    filename.unlink(missing_ok=True)
+
+# appends swept over append size, dtype, memory order and header rewrites
+def bench_append_sweep(total_bytes=64 * 1024**2):
+    dtypes = {
+        "uint8": np.dtype(np.uint8),
+        "float32": np.dtype(np.float32),
+        "float64": np.dtype(np.float64),
+        "structured": np.dtype([('a', '<i8'), ('b', '<f4'), ('c', 'S4')]),
+    }
+
+    for (dtype_name, dtype), append_bytes, fortran_order, rewrite in product(
+        dtypes.items(), [4 * 1024, 256 * 1024, 16 * 1024**2], [False, True],
+        [True, False]
+    ):
+        # structured dtypes have no Fortran order of their own
+        if fortran_order and dtype.names:
+            continue
+
+        rows = max(1, append_bytes // 8 // dtype.itemsize)
+        shape = (8, rows) if fortran_order else (rows, 8)
+        arr = np.zeros(shape, dtype=dtype, order='F' if fortran_order else 'C')
+        append_count = max(1, total_bytes // arr.nbytes)
+
+        def run():
+            with NpyAppendArray(
+                tmpfile, delete_if_exists=True,
+                rewrite_header_on_append=rewrite
+            ) as npaa:
+                for _ in range(append_count):
+                    npaa.append(arr)
+
+        report("{} {} x {} KiB, rewrite_header={}".format(
+            dtype_name, 'F' if fortran_order else 'C', arr.nbytes // 1024,
+            rewrite
+        ), arr.nbytes * append_count, best_of(run), dtype=dtype_name,
+            append_bytes=arr.nbytes, fortran_order=fortran_order,
+            rewrite_header_on_append=rewrite)
+
+# threads appending to a single file
+def bench_threads(append_count=512, rows=8192):
+    arr = np.ones((rows, 16), dtype=np.float64)
+    nbytes = arr.nbytes * append_count
+
+    def run(thread_count):
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            with ThreadPoolExecutor(thread_count) as executor:
+                list(executor.map(
+                    lambda _: npaa.append(arr), range(append_count)
+                ))
+
+    for thread_count in [1, 2, 4, 8]:
+        report("1 file, {} threads".format(thread_count),
+            nbytes, best_of(lambda: run(thread_count)),
+            thread_count=thread_count)
+
+# recover on a large file whose header lags behind by half of the data
+def bench_recover(size=512 * 1024**2):
+    arr = np.ones((size // 2 // 8 // 64, 64), dtype=np.float64)
+
+    def run(trim_zero_tail):
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            npaa.append(arr)
+        with open(tmpfile, 'ab') as fp:
+            fp.write(np.zeros_like(arr).tobytes())
+            fp.write(b'\0' * 4)
+        start = time.perf_counter()
+        npy_append_array.recover(tmpfile, trim_zero_tail=trim_zero_tail)
+        return time.perf_counter() - start
+
+    for trim_zero_tail in [False, True]:
+        report("recover trim_zero_tail={}".format(trim_zero_tail),
+            size, min(run(trim_zero_tail) for _ in range(3)),
+            trim_zero_tail=trim_zero_tail)
+
+# overhead of instrumentation on many small appends
+def bench_stats(append_count=20000, rows=10):
+    arr = np.ones((rows, 4), dtype=np.float32)
+    nbytes = arr.nbytes * append_count
+
+    def run(stats):
+        with NpyAppendArray(
+            tmpfile, delete_if_exists=True, stats=stats
+        ) as npaa:
+            for _ in range(append_count):
+                npaa.append(arr)
+
+    for stats in [None, AppendStats()]:
+        report("{} rows/append, stats={}".format(
+            rows, stats is not None
+        ), nbytes, best_of(lambda: run(stats)), stats=stats is not None)
+
+# appends which need a conversion, as a whole vs. block by block
+def bench_convert(append_count=8, rows=1024**2 // 2):
+    arr = np.ones((rows, 16), dtype=np.float64)
+    nbytes = arr.nbytes * append_count
+
+    def run(convert_bytes, convert_workers, fortran_order):
+        with NpyAppendArray(
+            tmpfile, delete_if_exists=True, convert_bytes=convert_bytes,
+            convert_workers=convert_workers
+        ) as npaa:
+            npaa.append(np.zeros((16, 2), dtype=np.float32, order='F')
+                if fortran_order else np.zeros((2, 16), dtype=np.float32))
+            for _ in range(append_count):
+                npaa.append(arr.T if fortran_order else arr)
+
+    # whole arrays, blocks one after another and blocks converted in a
+    # thread pool while earlier blocks are written
+    for fortran_order, (convert_bytes, convert_workers) in product(
+        [False, True], [(None, 0), (16 * 1024**2, 0), (16 * 1024**2, 2),
+            (16 * 1024**2, 4)]
+    ):
+        report("float64 to float32 {}, {}, {} workers".format(
+            'F' if fortran_order else 'C', "whole" if convert_bytes is None
+            else "{} MiB blocks".format(convert_bytes // 1024**2),
+            convert_workers
+        ), nbytes, best_of(
+            lambda: run(convert_bytes, convert_workers, fortran_order)
+        ), fortran_order=fortran_order, convert_bytes=convert_bytes,
+            convert_workers=convert_workers)
+
+# a generator of small arrays appended one by one vs. with append_stream,
+# and raw bytes read from a file object
+def bench_stream(append_count=100000, rows=4):
+    arr = np.ones((rows, 16), dtype=np.float32)
+    nbytes = arr.nbytes * append_count
+
+    def run_append():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            for _ in range(append_count):
+                npaa.append(arr)
+
+    def run_stream():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            npaa.append_stream(arr for _ in range(append_count))
+
+    def run_from_file():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa, \
+        open(source, 'rb') as fp:
+            npaa.append(arr[:0])
+            npaa.append_from_file(fp)
+
+    source = tmpfile.with_name('bench_raw.bin')
+    with open(source, 'wb') as fp:
+        for _ in range(append_count):
+            fp.write(arr.tobytes())
+
+    report("{} rows/append (append)".format(rows), nbytes, best_of(run_append))
+    report("{} rows/append (append_stream)".format(rows),
+        nbytes, best_of(run_stream))
+    report("raw file (append_from_file)", nbytes, best_of(run_from_file))
+
+    source.unlink()
+
+# appends spread over many files, reopening a file for every append vs. a
+# pool with a bounded number of open files and cached headers
+def bench_pool(file_count=2000, append_count=20000, max_open=64):
+    arr = np.ones((16, 8), dtype=np.float64)
+    nbytes = arr.nbytes * append_count
+    pooldir = tmpfile.with_name('bench_pool')
+    filenames = [pooldir / '{}.npy'.format(i) for i in range(file_count)]
+    order = np.random.default_rng(0).integers(file_count, size=append_count)
+
+    def prepare():
+        shutil.rmtree(pooldir, ignore_errors=True)
+        pooldir.mkdir()
+
+    def run_reopen():
+        prepare()
+        for i in order:
+            with NpyAppendArray(filenames[i]) as npaa:
+                npaa.append(arr)
+
+    def run_pool():
+        prepare()
+        with NpyAppendArrayPool(max_open=max_open) as pool:
+            for i in order:
+                pool.append(filenames[i], arr)
+
+    report("{} files, reopen per append".format(file_count),
+        nbytes, best_of(run_reopen))
+    report("{} files, pool of {}".format(file_count, max_open),
+        nbytes, best_of(run_pool), max_open=max_open)
+
+    shutil.rmtree(pooldir)
+
+# throwing away the last batch of a large file with rollback vs. rewriting
+# the file without it
+def bench_rollback(size=256 * 1024**2, batch_rows=1024):
+    arr = np.ones((size // 8 // 64, 64), dtype=np.float64)
+    batch = arr[:batch_rows]
+
+    def prepare():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            npaa.append(arr)
+
+    def run_rewrite():
+        prepare()
+        start = time.perf_counter()
+        data = np.load(tmpfile, mmap_mode='r')[:-batch_rows]
+        np.save(tmpfile.with_name('bench_rewrite.npy'), data)
+        del data
+        tmpfile.with_name('bench_rewrite.npy').replace(tmpfile)
+        return time.perf_counter() - start
+
+    def run_rollback():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            npaa.append(arr)
+            token = npaa.checkpoint()
+            npaa.append(batch)
+            start = time.perf_counter()
+            npaa.rollback(token)
+            return time.perf_counter() - start
+
+    # reported as the throughput relative to the file size
+    report("drop last batch (rewrite)",
+        size, min(run_rewrite() for _ in range(3)))
+    report("drop last batch (rollback)",
+        size, min(run_rollback() for _ in range(3)))
+
+# merging many files via np.load and append vs. concatenate_files
+def bench_concatenate(file_count=64, size=512 * 1024**2):
+    arr = np.ones((size // file_count // 8 // 64, 64), dtype=np.float64)
+    filenames = [
+        tmpfile.with_name('bench_part_{}.npy'.format(i))
+        for i in range(file_count)
+    ]
+    for filename in filenames:
+        np.save(filename, arr)
+
+    def run_append():
+        with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+            for filename in filenames:
+                npaa.append(np.load(filename))
+
+    report("{} files (np.load + append)".format(file_count),
+        size, best_of(run_append))
+    for max_workers in [1, 4]:
+        report("{} files (concatenate_files, {} workers)".format(
+            file_count, max_workers
+        ), size, best_of(lambda: npy_append_array.concatenate_files(
+            tmpfile, filenames, max_workers=max_workers
+        )), max_workers=max_workers)
+
+    for filename in filenames:
+        filename.unlink()
+
+benchmarks = [
+    bench_append_copy, bench_append_sweep, bench_threads, bench_multi_file,
+    bench_small_appends, bench_extend, bench_header_policy, bench_preallocate,
+    bench_reserve, bench_recover, bench_ensure_appendable, bench_multiprocess,
+    bench_compressed, bench_stats, bench_convert, bench_stream, bench_pool,
+    bench_rollback, bench_concatenate,
+]
+
+def environment():
+    try:
+        version = importlib.metadata.version('npy-append-array')
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=Path(__file__).parent
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "version": version, "commit": commit, "numpy": np.__version__,
+        "python": platform.python_version(), "platform": platform.platform(),
+        "machine": platform.machine(), "time": time.time(),
+    }
+
+# compares the throughput of matching records of two result files
+def compare(baseline_filename, threshold=0.9):
+    with open(baseline_filename) as fp:
+        baseline = {
+            (r["benchmark"], r["name"]): r for r in json.load(fp)["results"]
+        }
+
+    for r in results:
+        b = baseline.get((r["benchmark"], r["name"]))
+        if b is None:
+            continue
+        ratio = r["mib_per_s"] / b["mib_per_s"]
+        print("{:<48} {:>10.2f}x{}".format(
+            r["name"], ratio, "  REGRESSION" if ratio < threshold else ""
+        ))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--filter', default='',
+        help='only run benchmarks whose name contains this string')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='results file of a baseline run')
+    args = parser.parse_args()
+
+    for benchmark in benchmarks:
+        if args.filter not in benchmark.__name__:
+            continue
+
+        current_benchmark = benchmark.__name__
+        print("# {}".format(current_benchmark))
+
+        if benchmark is bench_append_copy:
+            for fortran_order in [False, True]:
+                bench_append_copy(fortran_order=fortran_order)
+        else:
+            benchmark()
+
+    tmpfile.unlink(missing_ok=True)
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump({
+                "environment": environment(), "results": results
+            }, fp, indent=1)
+
+    if args.compare:
+        compare(args.compare)
@@ -1 +1,8 @@
-from .npy_append_array import NpyAppendArray, recover, ensure_appendable, is_appendable
\ No newline at end of file
+from .npy_append_array import NpyAppendArray, HeaderPolicy, recover, ensure_appendable, is_appendable, concatenate_files
+from .stats import AppendStats
+from .pool import NpyAppendArrayPool
+from .dataset import NpyAppendDataset, NpyAppendDatasetReader
+from .tail import NpyTailReader
+from .ragged import NpyAppendRaggedArray, NpyAppendRaggedArrayReader, recover_ragged
+from .table import NpyAppendTable, NpyAppendTableReader, recover_table
+from .compressed import NpyAppendCompressedArray, NpyCompressedArrayReader, compress_npy, decompress_npy
\ No newline at end of file
@@ -0,0 +1,155 @@
+import os, sys, json, fnmatch, argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .npy_append_array import (
+    _HeaderInfo, _has_pending_reservations, _preallocated_filename, recover,
+    ensure_appendable
+)
+
+# python -m npy_append_array {check,recover,ensure-appendable} PATH...
+#
+# Walks files and directories and prints one JSON object per file. Only
+# headers and file sizes are read, unless a file actually has to be
+# changed. Exits with 1 if any file could not be processed.
+
+def _walk(paths, pattern):
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if fnmatch.fnmatch(filename, pattern):
+                    yield os.path.join(dirpath, filename)
+
+def _inspect(filename):
+    with open(filename, mode="rb") as fp:
+        hi = _HeaderInfo(fp)
+
+    pending_reservations = _has_pending_reservations(filename)
+
+    return {
+        "filename": filename,
+        "shape": list(hi.shape),
+        "dtype": str(hi.dtype),
+        "fortran_order": hi.fortran_order,
+        "header_size": hi.header_size,
+        "data_length": hi.data_length,
+        "appendable": hi.is_appendable,
+        "needs_recovery": hi.needs_recovery or pending_reservations,
+        "pending_reservations": pending_reservations,
+        "preallocated": os.path.exists(_preallocated_filename(filename)),
+    }
+
+def _process(task):
+    # module level, so that it can be sent to worker processes
+    command, filename, options = task
+
+    try:
+        report = _inspect(filename)
+        report["action"] = None
+
+        if command == "recover" and report["needs_recovery"]:
+            if not report["appendable"]:
+                msg = "header not appendable, please run ensure-appendable " \
+                    "first"
+                raise ValueError(msg)
+
+            report["action"] = "recover"
+            if not options["dry_run"]:
+                recover(
+                    filename,
+                    zerofill_incomplete=options["zerofill_incomplete"],
+                    trim_zero_tail=options["trim_zero_tail"]
+                )
+        elif command == "ensure-appendable" and not report["appendable"]:
+            report["action"] = "ensure_appendable"
+            if not options["dry_run"]:
+                ensure_appendable(filename, inplace=options["inplace"])
+
+        report["dry_run"] = options["dry_run"]
+    except Exception as e:
+        return {
+            "filename": filename,
+            "error": "{}: {}".format(type(e).__name__, e)
+        }
+
+    return report
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m npy_append_array",
+        description="Inspect, recover or upgrade many .npy files at once. "
+            "Prints one JSON object per file."
+    )
+    parser.add_argument(
+        "command", choices=["check", "recover", "ensure-appendable"]
+    )
+    parser.add_argument(
+        "paths", nargs="+", metavar="PATH",
+        help="files, or directories to search recursively"
+    )
+    parser.add_argument(
+        "--pattern", default="*.npy",
+        help="file name pattern in directories (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help="number of worker threads or processes"
+    )
+    parser.add_argument(
+        "--processes", action="store_true",
+        help="use worker processes instead of threads"
+    )
+    parser.add_argument(
+        "-n", "--dry-run", action="store_true",
+        help="only report what would be done"
+    )
+    parser.add_argument(
+        "--zerofill-incomplete", action="store_true",
+        help="recover: pad incomplete rows with zeros instead of cutting "
+            "them off"
+    )
+    parser.add_argument(
+        "--trim-zero-tail", action="store_true",
+        help="recover: cut off zero rows beyond the header's shape, also "
+            "for files not marked as preallocated"
+    )
+    parser.add_argument(
+        "--inplace", action="store_true",
+        help="ensure-appendable: rewrite files in place instead of via a copy"
+    )
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = _parse_args(argv)
+    options = {
+        "dry_run": args.dry_run,
+        "zerofill_incomplete": args.zerofill_incomplete,
+        "trim_zero_tail": args.trim_zero_tail,
+        "inplace": args.inplace,
+    }
+    tasks = (
+        (args.command, filename, options)
+        for filename in _walk(args.paths, args.pattern)
+    )
+
+    if args.processes:
+        executor, chunksize = ProcessPoolExecutor(args.jobs), 64
+    else:
+        executor, chunksize = ThreadPoolExecutor(args.jobs), 1
+
+    failed = False
+
+    with executor:
+        # reports are printed in the order of the files
+        for report in executor.map(_process, tasks, chunksize=chunksize):
+            failed = failed or "error" in report
+            print(json.dumps(report), flush=True)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
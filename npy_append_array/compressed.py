@@ -0,0 +1,397 @@
+import os, ast, bz2, lzma, zlib, struct, numpy
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import SEEK_END, SEEK_SET
+from math import prod
+from numpy.lib import format
+from .npy_append_array import NpyAppendArray, _index_rows
+
+# File layout, all integers little endian:
+#
+# - magic, uint32 header length and the header, a dict literal like in .npy
+#   files with descr, row_shape (the shape without the append axis 0),
+#   chunk_rows and codec
+# - chunks, each one a (compressed length, row count) uint64 pair followed
+#   by the compressed bytes
+# - on close, the chunk index: (offset, row count) uint64 pairs, followed by
+#   the offset of the index and the index magic
+#
+# The index allows random access without reading all chunks. If it is
+# missing, e.g. after a crash, it is rebuilt by walking the chunk headers.
+_MAGIC = b"\x93NPYCHUNK\x01\x00"
+_INDEX_MAGIC = b"NPYCIDX\x00"
+_CHUNK_HEADER = struct.Struct("<QQ")
+_FOOTER = struct.Struct("<Q8s")
+
+_CODECS = {
+    "zlib": (
+        lambda data, level: zlib.compress(data, 6 if level is None else level),
+        zlib.decompress
+    ),
+    "lzma": (
+        lambda data, level: lzma.compress(data, preset=level),
+        lzma.decompress
+    ),
+    "bz2": (
+        lambda data, level: bz2.compress(data, 9 if level is None else level),
+        bz2.decompress
+    ),
+}
+
+def _check_codec(codec):
+    if codec not in _CODECS:
+        msg = "codec must be one of {}".format(", ".join(sorted(_CODECS)))
+        raise ValueError(msg)
+
+def _read_header(fp):
+    if fp.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError("{} is not a compressed npy file".format(fp.name))
+
+    header_length, = struct.unpack("<I", fp.read(4))
+    header = ast.literal_eval(fp.read(header_length).decode("latin1"))
+    _check_codec(header["codec"])
+
+    return (
+        format.descr_to_dtype(header["descr"]), tuple(header["row_shape"]),
+        header["chunk_rows"], header["codec"]
+    )
+
+def _write_header(fp, dtype, row_shape, chunk_rows, codec):
+    header = repr({
+        "descr": format.dtype_to_descr(dtype),
+        "row_shape": row_shape,
+        "chunk_rows": chunk_rows,
+        "codec": codec,
+    }).encode("latin1")
+
+    fp.write(_MAGIC + struct.pack("<I", len(header)) + header)
+
+def _read_index(fp):
+    # returns the (offset, row count) pairs of all chunks and the offset at
+    # which the next chunk would start
+    data_start = fp.tell()
+    size = fp.seek(0, SEEK_END)
+
+    if size - data_start >= _FOOTER.size:
+        fp.seek(size - _FOOTER.size, SEEK_SET)
+        index_offset, magic = _FOOTER.unpack(fp.read(_FOOTER.size))
+
+        if magic == _INDEX_MAGIC:
+            fp.seek(index_offset, SEEK_SET)
+            index = numpy.frombuffer(
+                fp.read(size - _FOOTER.size - index_offset), dtype="<u8"
+            ).reshape(-1, 2)
+            return [tuple(map(int, entry)) for entry in index], index_offset
+
+    # no index, walk the chunk headers and ignore an incomplete last chunk
+    chunks, offset = [], data_start
+
+    while offset + _CHUNK_HEADER.size <= size:
+        fp.seek(offset, SEEK_SET)
+        nbytes, rows = _CHUNK_HEADER.unpack(fp.read(_CHUNK_HEADER.size))
+        if offset + _CHUNK_HEADER.size + nbytes > size:
+            break
+        chunks.append((offset, rows))
+        offset += _CHUNK_HEADER.size + nbytes
+
+    return chunks, offset
+
+class NpyAppendCompressedArray:
+    fp = None
+    __executor = None
+
+    def __init__(
+        self, filename, delete_if_exists=False, codec="zlib",
+        chunk_rows=65536, level=None, max_workers=None
+    ):
+        # codec, chunk_rows and level only apply to new files
+        _check_codec(codec)
+
+        self.filename = filename
+        self.__codec, self.__chunk_rows, self.__level = (
+            codec, chunk_rows, level
+        )
+        # compression releases the GIL, so chunks are compressed in a thread
+        # pool while earlier chunks are being written
+        max_workers = max_workers or os.cpu_count() or 1
+        self.__executor = ThreadPoolExecutor(max_workers)
+        self.__max_in_flight = 2 * max_workers
+        self.__in_flight = deque()
+        self.__pending, self.__pending_rows = [], 0
+        self.__chunks = []
+        self.dtype, self.__row_shape = None, None
+
+        if os.path.exists(filename):
+            if delete_if_exists:
+                os.unlink(filename)
+            else:
+                self.__init_from_file()
+
+    def __init_from_file(self):
+        fp = open(self.filename, "rb+")
+        self.fp = fp
+
+        self.dtype, self.__row_shape, self.__chunk_rows, self.__codec = \
+            _read_header(fp)
+        self.__chunks, end = _read_index(fp)
+
+        # the index (or an incomplete chunk) is overwritten by new chunks
+        fp.truncate(end)
+        fp.seek(end, SEEK_SET)
+
+    @property
+    def shape(self):
+        if self.dtype is None:
+            return None
+
+        rows = sum(rows for _, rows in self.__chunks) + self.__pending_rows + \
+            sum(rows for _, rows in self.__in_flight)
+
+        return (rows, *self.__row_shape)
+
+    def __compress(self, arr):
+        return _CODECS[self.__codec][0](
+            memoryview(numpy.ascontiguousarray(arr).view(numpy.uint8)),
+            self.__level
+        )
+
+    def __write_done(self, max_in_flight):
+        # chunks are compressed in parallel, but written in order; waits
+        # until at most max_in_flight chunks are left
+        in_flight = self.__in_flight
+
+        while in_flight and (
+            len(in_flight) > max_in_flight or in_flight[0][0].done()
+        ):
+            future, rows = in_flight.popleft()
+            data = future.result()
+            self.__chunks.append((self.fp.tell(), rows))
+            self.fp.write(_CHUNK_HEADER.pack(len(data), rows))
+            self.fp.write(data)
+
+    def __submit(self, arr):
+        self.__in_flight.append(
+            (self.__executor.submit(self.__compress, arr), len(arr))
+        )
+        self.__write_done(self.__max_in_flight)
+
+    def append(self, arr):
+        arr = numpy.asarray(arr)
+
+        if self.dtype is None:
+            self.dtype, self.__row_shape = arr.dtype, arr.shape[1:]
+            self.fp = open(self.filename, "wb+")
+            _write_header(
+                self.fp, self.dtype, self.__row_shape, self.__chunk_rows,
+                self.__codec
+            )
+
+        if arr.shape[1:] != self.__row_shape:
+            msg = "array shapes can only differ on append axis 0"
+            raise ValueError(msg)
+
+        # a copy, callers may reuse their buffer before the chunk is full
+        self.__pending.append(numpy.array(arr, dtype=self.dtype))
+        self.__pending_rows += len(arr)
+
+        if self.__pending_rows < self.__chunk_rows:
+            return
+
+        pending = numpy.concatenate(self.__pending)
+        full_rows = len(pending) // self.__chunk_rows * self.__chunk_rows
+
+        for start in range(0, full_rows, self.__chunk_rows):
+            self.__submit(pending[start:start + self.__chunk_rows])
+
+        self.__pending = [pending[full_rows:]]
+        self.__pending_rows = len(pending) - full_rows
+
+    def flush(self):
+        # writes all pending rows as a (possibly short) chunk
+        if self.fp is None:
+            return
+
+        if self.__pending_rows:
+            self.__submit(numpy.concatenate(self.__pending))
+            self.__pending, self.__pending_rows = [], 0
+
+        self.__write_done(0)
+        self.fp.flush()
+
+    def close(self):
+        if self.fp is not None:
+            self.flush()
+
+            index_offset = self.fp.tell()
+            self.fp.write(
+                numpy.array(self.__chunks, dtype="<u8").reshape(-1, 2)
+                .tobytes()
+            )
+            self.fp.write(_FOOTER.pack(index_offset, _INDEX_MAGIC))
+            self.fp.close()
+            self.fp = None
+
+        if self.__executor is not None:
+            self.__executor.shutdown()
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class NpyCompressedArrayReader:
+    fp = None
+
+    def __init__(self, filename, cache_chunks=4):
+        self.filename = filename
+        fp = open(filename, "rb")
+        self.fp = fp
+
+        self.dtype, row_shape, _, codec = _read_header(fp)
+        self.__decompress = _CODECS[codec][1]
+        chunks, _ = _read_index(fp)
+
+        self.__offsets = [offset for offset, _ in chunks]
+        self.__starts = [0]
+        for _, rows in chunks:
+            self.__starts.append(self.__starts[-1] + rows)
+
+        self.shape = (self.__starts[-1], *row_shape)
+
+        # recently decompressed chunks
+        self.__cache, self.__cache_size = {}, cache_chunks
+
+    def __len__(self):
+        return self.shape[0]
+
+    def iter_chunks(self):
+        for i in range(len(self.__offsets)):
+            yield self.__chunk(i)
+
+    def __chunk(self, index):
+        arr = self.__cache.pop(index, None)
+
+        if arr is None:
+            self.fp.seek(self.__offsets[index], SEEK_SET)
+            nbytes, rows = _CHUNK_HEADER.unpack(
+                self.fp.read(_CHUNK_HEADER.size)
+            )
+            arr = numpy.frombuffer(
+                self.__decompress(self.fp.read(nbytes)), dtype=self.dtype
+            ).reshape(rows, *self.shape[1:])
+
+        self.__cache[index] = arr
+        while len(self.__cache) > self.__cache_size:
+            del self.__cache[next(iter(self.__cache))]
+
+        return arr
+
+    def __read_rows(self, start, stop):
+        # decompresses only the chunks overlapping [start, stop)
+        if start >= stop:
+            return numpy.empty((0, *self.shape[1:]), dtype=self.dtype)
+
+        first = bisect_right(self.__starts, start) - 1
+        last = bisect_right(self.__starts, stop - 1) - 1
+
+        pieces = [
+            self.__chunk(i)[
+                max(start - self.__starts[i], 0):
+                min(stop, self.__starts[i + 1]) - self.__starts[i]
+            ] for i in range(first, last + 1)
+        ]
+
+        return pieces[0] if len(pieces) == 1 else numpy.concatenate(pieces)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            if not key:
+                return self[:]
+            return _index_rows(self.__getitem__, key)
+
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            rows = range(start, stop, step)
+            if not rows:
+                return self.__read_rows(0, 0)
+            if step > 0:
+                return self.__read_rows(rows[0], rows[-1] + 1)[::step]
+            return self.__read_rows(rows[-1], rows[0] + 1)[::-1][::-step]
+
+        if isinstance(key, (int, numpy.integer)):
+            index = int(key) + (len(self) if key < 0 else 0)
+            if not 0 <= index < len(self):
+                raise IndexError("index {} is out of bounds".format(key))
+            return self.__read_rows(index, index + 1)[0]
+
+        indices = numpy.asarray(key)
+        if indices.dtype == bool:
+            indices = numpy.flatnonzero(indices)
+        indices = numpy.where(indices < 0, indices + len(self), indices)
+
+        if numpy.any((indices < 0) | (indices >= len(self))):
+            raise IndexError("index out of bounds")
+
+        chunks = numpy.searchsorted(self.__starts, indices, side="right") - 1
+        result = numpy.empty(
+            (*indices.shape, *self.shape[1:]), dtype=self.dtype
+        )
+
+        for chunk in numpy.unique(chunks):
+            mask = chunks == chunk
+            result[mask] = self.__chunk(chunk)[
+                indices[mask] - self.__starts[chunk]
+            ]
+
+        return result
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self[:]
+        return arr if dtype is None else arr.astype(dtype)
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+def compress_npy(npy_filename, compressed_filename, **kwargs):
+    # keyword arguments are passed on to NpyAppendCompressedArray
+    arr = numpy.load(npy_filename, mmap_mode="r")
+
+    if arr.ndim == 0 or arr.dtype.hasobject:
+        raise ValueError("only arrays with an append axis can be compressed")
+
+    if arr.flags.f_contiguous and not arr.flags.c_contiguous:
+        raise ValueError("Fortran order arrays cannot be compressed")
+
+    with NpyAppendCompressedArray(
+        compressed_filename, delete_if_exists=True, **kwargs
+    ) as npca:
+        # read about 16 MiB at a time
+        row_bytes = prod(arr.shape[1:]) * arr.dtype.itemsize
+        step = max(1, 16 * 1024 ** 2 // max(1, row_bytes))
+
+        npca.append(arr[:0])
+        for start in range(0, len(arr), step):
+            npca.append(arr[start:start + step])
+
+def decompress_npy(compressed_filename, npy_filename):
+    with NpyCompressedArrayReader(compressed_filename) as reader, \
+    NpyAppendArray(npy_filename, delete_if_exists=True) as npaa:
+        npaa.append(numpy.empty((0, *reader.shape[1:]), dtype=reader.dtype))
+        for chunk in reader.iter_chunks():
+            npaa.append(chunk)
@@ -0,0 +1,277 @@
+import os, json, numpy
+from bisect import bisect_right
+from math import prod
+from .npy_append_array import NpyAppendArray, _index_rows
+
+_MANIFEST_FILENAME = "manifest.json"
+
+def _shard_filename(index):
+    return "shard_{:06d}.npy".format(index)
+
+def _read_manifest(dirname):
+    with open(os.path.join(dirname, _MANIFEST_FILENAME)) as fp:
+        return json.load(fp)["shards"]
+
+def _write_manifest(dirname, shards):
+    # write and rename, so that readers never see a partial manifest
+    filename = os.path.join(dirname, _MANIFEST_FILENAME)
+    with open(filename + ".tmp", "w") as fp:
+        json.dump({"shards": shards}, fp)
+    os.replace(filename + ".tmp", filename)
+
+class NpyAppendDataset:
+    __npaa = None
+
+    def __init__(
+        self, dirname, max_shard_bytes=None, max_shard_rows=None,
+        delete_if_exists=False, **kwargs
+    ):
+        # keyword arguments are passed on to NpyAppendArray for each shard
+        self.dirname = dirname
+        self.__max_shard_bytes = max_shard_bytes
+        self.__max_shard_rows = max_shard_rows
+        self.__kwargs = kwargs
+        self.__shards = []
+        self.dtype = None
+
+        os.makedirs(dirname, exist_ok=True)
+
+        if os.path.exists(os.path.join(dirname, _MANIFEST_FILENAME)):
+            if delete_if_exists:
+                for shard in _read_manifest(dirname):
+                    filename = os.path.join(dirname, shard["filename"])
+                    if os.path.exists(filename):
+                        os.unlink(filename)
+                os.unlink(os.path.join(dirname, _MANIFEST_FILENAME))
+            else:
+                self.__shards = _read_manifest(dirname)
+
+        # a shard file is only created by its first append, so the last
+        # shard in the manifest may not exist yet; it is started over
+        while self.__shards and not os.path.exists(
+            os.path.join(dirname, self.__shards[-1]["filename"])
+        ):
+            self.__shards.pop()
+
+        if self.__shards:
+            self.__open_shard(self.__shards[-1]["filename"])
+
+    def __open_shard(self, filename):
+        npaa = NpyAppendArray(
+            os.path.join(self.dirname, filename), **self.__kwargs
+        )
+        self.__npaa = npaa
+
+        if npaa.fortran_order:
+            npaa.close()
+            raise ValueError("datasets can only be appended to on axis 0")
+
+        self.dtype, self.__row_shape = npaa.dtype, npaa.shape[1:]
+
+        # the header of the active shard is more recent than the manifest
+        self.__shards[-1]["rows"] = npaa.shape[0]
+
+    def __shard_row_limit(self):
+        limits = [] if self.__max_shard_rows is None \
+            else [self.__max_shard_rows]
+
+        if self.__max_shard_bytes is not None:
+            row_bytes = prod(self.__row_shape) * self.dtype.itemsize
+            if row_bytes:
+                limits.append(max(1, self.__max_shard_bytes // row_bytes))
+
+        return min(limits) if limits else None
+
+    def __roll(self):
+        if self.__npaa is not None:
+            self.__npaa.close()
+
+        filename = _shard_filename(len(self.__shards))
+        self.__shards.append({"filename": filename, "rows": 0})
+        self.__npaa = NpyAppendArray(
+            os.path.join(self.dirname, filename), delete_if_exists=True,
+            **self.__kwargs
+        )
+
+    def append(self, arr):
+        arr = numpy.asarray(arr)
+
+        if self.__npaa is None:
+            self.dtype, self.__row_shape = arr.dtype, arr.shape[1:]
+            self.__roll()
+            _write_manifest(self.dirname, self.__shards)
+
+        if arr.shape[1:] != self.__row_shape:
+            msg = "array shapes can only differ on append axis 0"
+            raise ValueError(msg)
+
+        limit = self.__shard_row_limit()
+
+        while True:
+            rows = self.__shards[-1]["rows"]
+            count = len(arr) if limit is None else max(
+                0, min(len(arr), limit - rows)
+            )
+
+            # the first append to a new shard determines its dtype and order
+            if rows == 0:
+                self.__npaa.append(numpy.ascontiguousarray(
+                    arr[:count], dtype=self.dtype
+                ))
+            elif count:
+                self.__npaa.append(arr[:count])
+
+            self.__shards[-1]["rows"] = rows + count
+            arr = arr[count:]
+
+            if not len(arr):
+                break
+
+            self.__roll()
+            _write_manifest(self.dirname, self.__shards)
+
+    @property
+    def shape(self):
+        if self.dtype is None:
+            return None
+
+        return (len(self), *self.__row_shape)
+
+    def __len__(self):
+        return sum(shard["rows"] for shard in self.__shards)
+
+    def flush(self):
+        if self.__npaa is not None:
+            self.__npaa.flush()
+            _write_manifest(self.dirname, self.__shards)
+
+    def close(self):
+        if self.__npaa is not None:
+            self.__npaa.close()
+            self.__npaa = None
+            _write_manifest(self.dirname, self.__shards)
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+class NpyAppendDatasetReader:
+    def __init__(self, dirname):
+        self.dirname = dirname
+        shards = [
+            shard for shard in _read_manifest(dirname) if shard["rows"]
+        ]
+
+        self.__filenames = [shard["filename"] for shard in shards]
+        self.__arrays = [None] * len(shards)
+
+        # first row of each shard, plus the total row count at the end
+        self.__starts = [0]
+        for shard in shards:
+            self.__starts.append(self.__starts[-1] + shard["rows"])
+
+        first = self.__shard(0) if shards else numpy.empty((0,))
+        self.dtype = first.dtype
+        self.shape = (self.__starts[-1], *first.shape[1:])
+
+    def __shard(self, index):
+        # memory map shards lazily, only when they are accessed
+        arr = self.__arrays[index]
+
+        if arr is None:
+            arr = numpy.load(os.path.join(
+                self.dirname, self.__filenames[index]
+            ), mmap_mode="r")
+            # the manifest may lag behind the shard's header
+            arr = arr[:self.__starts[index + 1] - self.__starts[index]]
+            self.__arrays[index] = arr
+
+        return arr
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            if not key:
+                return self[:]
+            return _index_rows(self.__getitem__, key)
+
+        if isinstance(key, slice):
+            return self.__get_slice(key)
+
+        if isinstance(key, (int, numpy.integer)):
+            index = int(key) + (len(self) if key < 0 else 0)
+            if not 0 <= index < len(self):
+                raise IndexError("index {} is out of bounds".format(key))
+
+            shard = bisect_right(self.__starts, index) - 1
+
+            return self.__shard(shard)[index - self.__starts[shard]]
+
+        return self.__get_indices(numpy.asarray(key))
+
+    def __get_slice(self, key):
+        start, stop, step = key.indices(len(self))
+
+        if step < 0:
+            rows = range(start, stop, step)
+            if not rows:
+                return self.__get_slice(slice(0, 0))
+            return self.__get_slice(
+                slice(rows[-1], rows[0] + 1, -step)
+            )[::-1]
+
+        pieces = []
+        shard = bisect_right(self.__starts, start) - 1
+
+        while start < stop and shard < len(self.__filenames):
+            shard_start = self.__starts[shard]
+            shard_stop = self.__starts[shard + 1]
+
+            pieces.append(self.__shard(shard)[
+                start - shard_start:min(stop, shard_stop) - shard_start:step
+            ])
+
+            # first row in the next shard which is hit by step
+            start += -(-(shard_stop - start) // step) * step
+            shard = bisect_right(self.__starts, start) - 1
+
+        if len(pieces) == 1:
+            return pieces[0]
+
+        if not pieces:
+            return numpy.empty((0, *self.shape[1:]), dtype=self.dtype)
+
+        return numpy.concatenate(pieces)
+
+    def __get_indices(self, indices):
+        if indices.dtype == bool:
+            indices = numpy.flatnonzero(indices)
+
+        indices = numpy.where(indices < 0, indices + len(self), indices)
+
+        if numpy.any((indices < 0) | (indices >= len(self))):
+            raise IndexError("index out of bounds")
+
+        shards = numpy.searchsorted(self.__starts, indices, side="right") - 1
+        result = numpy.empty(
+            (*indices.shape, *self.shape[1:]), dtype=self.dtype
+        )
+
+        for shard in numpy.unique(shards):
+            mask = shards == shard
+            result[mask] = self.__shard(shard)[
+                indices[mask] - self.__starts[shard]
+            ]
+
+        return result
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self[:]
+        return arr if dtype is None else arr.astype(dtype)
@@ -185,6 +185,20 @@ def _wrap_header(header, version, header_len=None):
     padlen = format.ARRAY_ALIGN - ((
         format.MAGIC_LEN + struct.calcsize(fmt) + hlen
     ) % format.ARRAY_ALIGN)
+
+    # the extra padding for header_len has to be part of the header length
+    # stored in the prefix, otherwise readers would stop before the data
+    if header_len is not None:
+        actual_header_len = format.MAGIC_LEN + struct.calcsize(fmt) + \
+            hlen + padlen
+        if actual_header_len > header_len:
+            msg = (
+                "Header length {} too big for specified header "+
+                "length {}, version={}"
+            ).format(actual_header_len, header_len, version)
+            raise ValueError(msg) from None
+        padlen += header_len - actual_header_len
+
     try:
         header_prefix = format.magic(*version) + struct.pack(
             fmt, hlen + padlen
@@ -200,16 +214,6 @@ def _wrap_header(header, version, header_len=None):
     # offset must be page-aligned (i.e. the beginning of the file).
     header = header_prefix + header + b' '*padlen 
     
-    if header_len is not None:
-        actual_header_len = len(header) + 1
-        if actual_header_len > header_len:
-            msg = (
-                "Header length {} too big for specified header "+
-                "length {}, version={}"
-            ).format(actual_header_len, header_len, version)
-            raise ValueError(msg) from None
-        header += b' '*(header_len - actual_header_len)
-    
     return header + b'\n'
 
 
@@ -1,12 +1,128 @@
-import os, tempfile, threading
+import os, sys, mmap, struct, tempfile, threading, queue, asyncio, time
+import numpy
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from numpy.lib import format
-from .format import _read_array_header, _write_array_header, write_array
-from io import BytesIO, SEEK_END, SEEK_SET
+from .format import (
+    _read_array_header, _write_array_header, write_array, _MAX_HEADER_SIZE
+)
+from .stats import _TimedLock
+from io import BytesIO, SEEK_CUR, SEEK_END, SEEK_SET
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 # would prefer numpy.multiply.reduce or numpy.ceil, but has issues on win32,
 # since the default dtype is int32 there, even on 64 bit systems, see
 # https://stackoverflow.com/q/36278590
 from math import prod, ceil
 
+def _as_bytes(arr, dtype, fortran_order):
+    order = 'F' if fortran_order else 'C'
+
+    # astype with copy=False and ravel only copy if dtype or memory layout
+    # actually differ, so contiguous arrays of the right dtype are written
+    # straight from their buffer
+    data = arr.astype(
+        dtype, order=order, copy=False
+    ).ravel(order=order)
+
+    return memoryview(data.view(numpy.uint8))
+
+def _map_array(map_, shape, dtype, offset, fortran_order):
+    # numpy.frombuffer exports the map's buffer for as long as the array
+    # lives, so the map cannot be closed under it (numpy.ndarray with
+    # buffer=map_ would not)
+    return numpy.frombuffer(
+        map_, dtype=dtype, count=prod(shape), offset=offset
+    ).reshape(shape, order='F' if fortran_order else 'C')
+
+def _blocks(arr, dtype, fortran_order, chunk_bytes):
+    # splits arrays which have to be converted into views along the append
+    # axis, so that at most about chunk_bytes are copied at a time by
+    # _as_bytes instead of the whole array
+    contiguous = arr.flags.f_contiguous if fortran_order \
+        else arr.flags.c_contiguous
+
+    if not chunk_bytes or arr.ndim == 0 or \
+    (contiguous and arr.dtype == dtype):
+        return [arr]
+
+    count = arr.shape[-1 if fortran_order else 0]
+    row_bytes = arr.size // max(1, count) * max(
+        arr.dtype.itemsize, dtype.itemsize
+    )
+    step = max(1, chunk_bytes // max(1, row_bytes))
+
+    return [
+        arr[..., start:start + step] if fortran_order
+        else arr[start:start + step] for start in range(0, count, step)
+    ]
+
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = -1
+_IOV_MAX = _IOV_MAX if _IOV_MAX > 0 else 1024
+
+def _write_all(fp, buffers):
+    if not hasattr(os, 'writev'):
+        for buffer in buffers:
+            fp.write(buffer)
+        return
+
+    fp.flush()
+    fd = fp.fileno()
+    buffers = [buffer for buffer in buffers if buffer.nbytes]
+    i = 0
+
+    # os.writev may write less than requested, continue where it stopped
+    while i < len(buffers):
+        written = os.writev(fd, buffers[i:i + _IOV_MAX])
+
+        while i < len(buffers) and written >= buffers[i].nbytes:
+            written -= buffers[i].nbytes
+            i += 1
+
+        if written:
+            buffers[i] = buffers[i][written:]
+
+    # resynchronize the file object with the file descriptor's position
+    fp.seek(os.lseek(fd, 0, SEEK_CUR), SEEK_SET)
+
+def _index_rows(get_rows, key):
+    # applies a tuple key for readers which can only select rows on axis 0,
+    # get_rows being their indexing of rows; the row selection is turned
+    # into an index into the rows read, so that the rest of the key applies
+    # to the same axes and broadcasts the same way as with numpy
+    first, rest = key[0], key[1:]
+
+    if isinstance(first, slice):
+        return get_rows(first)[(slice(None), *rest)]
+
+    if isinstance(first, (int, numpy.integer)):
+        return get_rows(first)[rest]
+
+    if first is Ellipsis or first is None:
+        return get_rows(slice(None))[key]
+
+    indices = numpy.asarray(first)
+
+    if indices.dtype == bool:
+        if indices.ndim != 1:
+            return get_rows(slice(None))[key]
+        indices = numpy.flatnonzero(indices)
+
+    positions = numpy.arange(indices.size).reshape(indices.shape)
+
+    return get_rows(indices.ravel())[(positions, *rest)]
+
+# minimum step by which reserve grows the file and its memory map
+_RESERVE_MIN_BYTES = 16 * 1024 ** 2
+
+# preallocated extents double up to this size, unless more is needed at once
+_PREALLOCATE_MAX_BYTES = 1024 ** 3
+
 class _HeaderInfo():
     def __init__(self, fp):
         version = format.read_magic(fp)
@@ -36,13 +152,170 @@ class _HeaderInfo():
             self.data_length == prod(shape) * dtype.itemsize
         )
 
+# Multi-process appends keep their state in a sidecar file next to the .npy
+# file, locked with fcntl.flock: a little endian uint64 with the end of all
+# reserved byte ranges, followed by (offset, length) pairs of ranges that
+# have been reserved but not completely written yet. Finished ranges are
+# released by setting their length to 0.
+def _reservations_filename(filename):
+    return os.fspath(filename) + ".reservations"
+
+def _read_reservations(fd):
+    os.lseek(fd, 0, SEEK_SET)
+    content = os.read(fd, os.fstat(fd).st_size)
+    values = struct.unpack("<{}Q".format(len(content) // 8), content[
+        :len(content) // 8 * 8
+    ])
+
+    if not values:
+        return None, []
+
+    return values[0], list(zip(values[1::2], values[2::2]))
+
+def _has_pending_reservations(filename):
+    try:
+        fd = os.open(_reservations_filename(filename), os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+
+    try:
+        return any(length for _, length in _read_reservations(fd)[1])
+    finally:
+        os.close(fd)
+
+def _recover_reservations(filename):
+    # ranges reserved by crashed writers are filled with zeros
+    reservations_filename = _reservations_filename(filename)
+
+    if not os.path.exists(reservations_filename):
+        return
+
+    fd = os.open(reservations_filename, os.O_RDONLY)
+    try:
+        _, slots = _read_reservations(fd)
+    finally:
+        os.close(fd)
+
+    with open(filename, mode="rb+") as fp:
+        size = fp.seek(0, SEEK_END)
+
+        for offset, length in slots:
+            end = min(offset + length, size)
+            fp.seek(offset, SEEK_SET)
+            while fp.tell() < end:
+                fp.write(b'\0' * min(16 * 1024 ** 2, end - fp.tell()))
+
+    os.unlink(reservations_filename)
+
+# Writers which preallocate space beyond their data leave an empty sidecar
+# file next to the .npy file until they have trimmed it again on close, so
+# that recover knows that zeros beyond the header's shape are not data.
+def _preallocated_filename(filename):
+    return os.fspath(filename) + ".preallocated"
+
+def _remove_preallocated(filename):
+    try:
+        os.unlink(_preallocated_filename(filename))
+    except FileNotFoundError:
+        pass
+
 def is_appendable(filename):
     with open(filename, mode="rb") as fp:
         return _HeaderInfo(fp).is_appendable
 
 def needs_recovery(filename):
     with open(filename, mode="rb") as fp:
-        return _HeaderInfo(fp).needs_recovery
+        return _HeaderInfo(fp).needs_recovery or \
+            _has_pending_reservations(filename)
+
+def _truncate(filename, count):
+    # cuts a file down to count items on the append axis; the data goes
+    # first, so that a crash in between leaves a file recover can handle
+    with open(filename, mode="rb+") as fp:
+        hi = _HeaderInfo(fp)
+        shape = list(hi.shape)
+        axis = -1 if hi.fortran_order else 0
+        shape[axis] = min(count, shape[axis])
+
+        fp.truncate(hi.header_size + prod(shape) * hi.dtype.itemsize)
+
+        fp.seek(0, SEEK_SET)
+        _write_array_header(fp, {
+            "shape": tuple(shape),
+            "fortran_order": hi.fortran_order,
+            "descr": format.dtype_to_descr(hi.dtype)
+        }, header_len=hi.header_size)
+
+def _copy_range(src_fd, dst_fd, src_offset, dst_offset, length):
+    end = src_offset + length
+
+    # copy kernel side where possible, so the data never passes through
+    # Python; both calls may be unsupported for a given pair of files
+    if hasattr(os, "copy_file_range"):
+        try:
+            while src_offset < end:
+                copied = os.copy_file_range(
+                    src_fd, dst_fd, end - src_offset, src_offset, dst_offset
+                )
+                if copied == 0:
+                    break
+                src_offset += copied
+                dst_offset += copied
+        except OSError:
+            pass
+
+    if src_offset < end and sys.platform.startswith("linux"):
+        try:
+            os.lseek(dst_fd, dst_offset, SEEK_SET)
+            while src_offset < end:
+                copied = os.sendfile(
+                    dst_fd, src_fd, src_offset, end - src_offset
+                )
+                if copied == 0:
+                    break
+                src_offset += copied
+                dst_offset += copied
+        except OSError:
+            pass
+
+    # Set buffer size to 16 MiB to hide the Python loop overhead
+    buffersize = 16 * 1024 ** 2
+
+    while src_offset < end:
+        os.lseek(src_fd, src_offset, SEEK_SET)
+        content = os.read(src_fd, min(buffersize, end - src_offset))
+        if not content:
+            break
+
+        os.lseek(dst_fd, dst_offset, SEEK_SET)
+        view = memoryview(content)
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+        src_offset += len(content)
+        dst_offset += len(content)
+
+# from linux/falloc.h
+_FALLOC_FL_INSERT_RANGE = 0x20
+
+def _insert_range(fd, length):
+    # inserts length zero bytes at the start of the file without moving any
+    # data, only supported by some Linux file systems (e.g. ext4 and XFS)
+    # and only for multiples of the file system block size
+    if not sys.platform.startswith("linux"):
+        return False
+
+    try:
+        import ctypes
+        fallocate = ctypes.CDLL(None, use_errno=True).fallocate
+    except (ImportError, OSError, AttributeError):
+        return False
+
+    fallocate.argtypes = [
+        ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64
+    ]
+
+    return fallocate(fd, _FALLOC_FL_INSERT_RANGE, 0, length) == 0
 
 def ensure_appendable(filename, inplace=False):
     with open(filename, mode="rb+") as fp:
@@ -59,9 +332,30 @@ def ensure_appendable(filename, inplace=False):
         # Set buffer size to 16 MiB to hide the Python loop overhead, see
         # https://github.com/numpy/numpy/blob/main/numpy/lib/format.py
         buffersize = min(16 * 1024 ** 2, data_length)
-        buffer_count = int(ceil(data_length / buffersize))
+        buffer_count = int(ceil(data_length / buffersize)) if buffersize \
+            else 0
 
         if inplace:
+            # insert whole blocks in front of the old header and pad the new
+            # header to cover both, the data stays where it is on disk
+            blocksize = os.fstat(fp.fileno()).st_blksize
+            insert_length = int(ceil(
+                (new_header_size - header_size) / blocksize
+            )) * blocksize
+
+            if header_size + insert_length <= _MAX_HEADER_SIZE and \
+            _insert_range(fp.fileno(), insert_length):
+                padded_header = BytesIO()
+                _write_array_header(padded_header, {
+                    "shape": hi.shape,
+                    "fortran_order": hi.fortran_order,
+                    "descr": format.dtype_to_descr(hi.dtype)
+                }, header_len=header_size + insert_length)
+                os.lseek(fp.fileno(), 0, SEEK_SET)
+                os.write(fp.fileno(), padded_header.getvalue())
+
+                return True
+
             for i in reversed(range(buffer_count)):
                 offset = i * buffersize
                 fp.seek(header_size + offset, SEEK_SET)
@@ -80,23 +374,162 @@ def ensure_appendable(filename, inplace=False):
             prefix=basename, dir=dirname, delete=False
         ).name, 'wb+')
         fp2.write(new_header)
+        fp2.flush()
 
-        fp.seek(header_size, SEEK_SET)
-        for _ in range(buffer_count):
-            fp2.write(fp.read(buffersize))
+        _copy_range(
+            fp.fileno(), fp2.fileno(), header_size, new_header_size,
+            data_length
+        )
 
     fp2.close()
     os.replace(fp2.name, fp.name)
 
     return True
 
-def recover(filename, zerofill_incomplete=False):
+def _read_input_header(filename):
+    with open(filename, mode="rb") as fp:
+        version = format.read_magic(fp)
+        shape, fortran_order, dtype = _read_array_header(fp, version)
+        header_size = fp.tell()
+        data_length = os.fstat(fp.fileno()).st_size - header_size
+
+    if dtype.hasobject:
+        raise ValueError("{}: object arrays cannot be concatenated".format(
+            filename
+        ))
+
+    # bytes beyond the header's shape (e.g. preallocated) are not copied
+    if data_length < prod(shape) * dtype.itemsize:
+        msg = "{} is shorter than its header, please call " \
+            "npy_append_array.recover".format(filename)
+        raise ValueError(msg)
+
+    return shape, fortran_order, dtype, header_size
+
+def _copy_input(filename, src_offset, dst_filename, dst_offset, length):
+    # own file descriptors per call, _copy_range may seek
+    binary = getattr(os, "O_BINARY", 0)
+    src_fd = os.open(filename, os.O_RDONLY | binary)
+    try:
+        dst_fd = os.open(dst_filename, os.O_WRONLY | binary)
+        try:
+            _copy_range(src_fd, dst_fd, src_offset, dst_offset, length)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+def concatenate_files(out, inputs, max_workers=1):
+    # concatenates .npy files on their append axis into a new, appendable
+    # file; all headers are checked before any data is copied, data is
+    # copied kernel side where possible, with max_workers > 1 in parallel
+    inputs = list(inputs)
+
+    if not inputs:
+        raise ValueError("no input files given")
+
+    if any(os.path.exists(out) and os.path.samefile(out, filename)
+    for filename in inputs):
+        raise ValueError("the output file cannot be one of the inputs")
+
+    headers = [_read_input_header(filename) for filename in inputs]
+    shape, fortran_order, dtype, _ = headers[0]
+    axis = -1 if fortran_order else 0
+
+    for filename, (shape2, fortran_order2, dtype2, _) in zip(
+        inputs, headers
+    ):
+        # the memory order does not matter for 0 and 1 dimensional arrays
+        if dtype2 != dtype or len(shape2) != len(shape) or \
+        (len(shape) > 1 and fortran_order2 != fortran_order) or \
+        shape2[:axis] + shape2[axis:][1:] != shape[:axis] + shape[axis:][1:]:
+            msg = (
+                "{}: shape {}, fortran_order {} and dtype {} do not match "
+                "shape {}, fortran_order {} and dtype {} of {}"
+            ).format(
+                filename, shape2, fortran_order2, dtype2, shape,
+                fortran_order, dtype, inputs[0]
+            )
+            raise ValueError(msg)
+
+    if not shape:
+        raise ValueError("0 dimensional arrays cannot be concatenated")
+
+    new_shape = list(shape)
+    new_shape[axis] = sum(shape2[axis] for shape2, _, _, _ in headers)
+
+    # write to a temporary file next to out and rename it in the end, so
+    # that out is never seen half written
+    dirname, basename = os.path.split(os.path.abspath(out))
+    fp = open(tempfile.NamedTemporaryFile(
+        prefix=basename, dir=dirname, delete=False
+    ).name, "wb+")
+
+    try:
+        with fp:
+            _write_array_header(fp, {
+                "shape": tuple(new_shape),
+                "fortran_order": fortran_order,
+                "descr": format.dtype_to_descr(dtype)
+            })
+
+            # precomputed offsets, so that inputs can be copied in any order
+            tasks, offset = [], fp.tell()
+            for filename, (shape2, _, _, header_size) in zip(
+                inputs, headers
+            ):
+                length = prod(shape2) * dtype.itemsize
+                tasks.append((filename, header_size, fp.name, offset, length))
+                offset += length
+
+            fp.flush()
+            fp.truncate(offset)
+
+        if max_workers > 1 and len(tasks) > 1:
+            with ThreadPoolExecutor(max_workers) as executor:
+                for future in [
+                    executor.submit(_copy_input, *task) for task in tasks
+                ]:
+                    future.result()
+        else:
+            for task in tasks:
+                _copy_input(*task)
+
+        os.replace(fp.name, out)
+    except BaseException:
+        os.unlink(fp.name)
+        raise
+
+    return tuple(new_shape)
+
+def _zero_tail_start(fp, start, end):
+    # returns the offset after the last non-zero byte in [start, end)
+    buffersize = 16 * 1024 ** 2
+
+    while end > start:
+        size = min(buffersize, end - start)
+        fp.seek(end - size, SEEK_SET)
+        nonzero_length = len(fp.read(size).rstrip(b'\0'))
+
+        if nonzero_length:
+            return end - size + nonzero_length
+
+        end -= size
+
+    return start
+
+def recover(filename, zerofill_incomplete=False, trim_zero_tail=False):
+    _recover_reservations(filename)
+
+    preallocated = os.path.exists(_preallocated_filename(filename))
+
     with open(filename, mode="rb+") as fp:
         hi = _HeaderInfo(fp)
         shape, fortran_order, dtype = hi.shape, hi.fortran_order, hi.dtype
         header_size, data_length = hi.header_size, hi.data_length
 
         if not hi.needs_recovery:
+            _remove_preallocated(filename)
             return True
 
         if not hi.is_appendable:
@@ -107,11 +540,30 @@ def recover(filename, zerofill_incomplete=False):
             shape[slice(None, None, -1 if fortran_order else 1)][1:]
         ) * dtype.itemsize
 
+        # zeros beyond the header's shape may be space preallocated by
+        # NpyAppendArray(preallocate=...), cut them off down to the last row
+        # containing data, but never below the header's shape; done for
+        # files marked as preallocated, see _preallocated_filename
+        if trim_zero_tail or preallocated:
+            header_data_length = prod(shape) * dtype.itemsize
+            trimmed_length = _zero_tail_start(
+                fp, header_size + min(header_data_length, data_length),
+                header_size + data_length
+            ) - header_size
+            trimmed_length = min(data_length, int(ceil(
+                trimmed_length / append_axis_itemsize
+            )) * append_axis_itemsize)
+
+            if trimmed_length < data_length:
+                data_length = trimmed_length
+                fp.truncate(header_size + data_length)
+
         trailing_bytes = data_length % append_axis_itemsize
 
         if trailing_bytes != 0:
             if zerofill_incomplete is True:
                 zero_bytes_to_append = append_axis_itemsize - trailing_bytes
+                fp.seek(header_size + data_length, SEEK_SET)
                 fp.write(b'\0'*(zero_bytes_to_append))
                 data_length += zero_bytes_to_append
             else:
@@ -129,29 +581,276 @@ def recover(filename, zerofill_incomplete=False):
             "descr": format.dtype_to_descr(dtype)
         }, header_len=header_size)
 
+    _remove_preallocated(filename)
+
     return True
 
+# tells an every_appends that was not passed from an explicit None, which
+# means that the number of appends is not a trigger
+_UNSET = object()
+
+class HeaderPolicy:
+    def __init__(
+        self, every_appends=_UNSET, every_seconds=None, every_bytes=None,
+        sync=None
+    ):
+        if sync not in (None, "fsync", "fdatasync"):
+            raise ValueError("sync must be None, 'fsync' or 'fdatasync'")
+
+        # every append only if no trigger is given at all
+        if every_appends is _UNSET:
+            every_appends = 1 if every_seconds is None and \
+                every_bytes is None else None
+
+        self.every_appends = every_appends
+        self.every_seconds = every_seconds
+        self.every_bytes = every_bytes
+        self.sync = sync
+
+    def is_due(self, appends, seconds, nbytes):
+        # seconds are only checked on append, there is no timer thread
+        return (
+            self.every_appends is not None and appends >= self.every_appends
+        ) or (
+            self.every_seconds is not None and seconds >= self.every_seconds
+        ) or (
+            self.every_bytes is not None and nbytes >= self.every_bytes
+        )
+
 class NpyAppendArray:
     fp = None
-    __lock, __is_init, __header_length = threading.Lock(), False, None
+    __lock, __is_init, __header_length = None, False, None
+    __writer = None
+    __pending_appends, __pending_bytes, __header_time = 0, 0, 0.0
+    __mmap, __read_mmap, __old_maps, __mapped_end = None, None, (), 0
+    __reservations = None
+    __preallocated, __extent_bytes = False, 0
+    __stats = None
+    __executor = None
+    __multiprocess = False
 
     def __init__(
         self, filename, delete_if_exists=False,
-        rewrite_header_on_append=True
+        rewrite_header_on_append=True, lock=None, buffer_bytes=None,
+        max_pending=16, header_policy=None, preallocate=None,
+        multiprocess=False, stats=None, convert_bytes=16 * 1024 ** 2,
+        convert_workers=2, header=None
     ):
+        # one lock per instance by default, so that different files can be
+        # written in parallel; pass a shared lock to serialize across files
+        self.__lock = threading.Lock() if lock is None else lock
         self.filename = filename
-        self.__rewrite_header_on_append = rewrite_header_on_append
 
-        if os.path.exists(filename):
-            if delete_if_exists:
+        # optional AppendStats, without them nothing is measured
+        if stats is not None:
+            self.__lock = _TimedLock(self.__lock, stats)
+        self.__stats = stats
+
+        # arrays which need a dtype or memory order conversion are converted
+        # and written in blocks of about convert_bytes, None converts them
+        # as a whole; with convert_workers, blocks are converted in parallel
+        # while earlier blocks are being written
+        self.__convert_bytes = convert_bytes
+        self.__convert_workers = convert_workers
+
+        # rewrite_header_on_append is a shorthand for the two simplest
+        # policies: rewrite on every append or only on close
+        if header_policy is None:
+            header_policy = HeaderPolicy(
+                every_appends=1 if rewrite_header_on_append else None
+            )
+        self.__header_policy = header_policy
+
+        # group commit: one fsync covers all commits made before it started
+        self.__sync_condition = threading.Condition()
+        self.__commit_seq, self.__synced_seq = 0, 0
+        self.__is_syncing = False
+
+        # optional staging buffer, small appends are collected here and
+        # written in large sequential chunks
+        self.__buffer = numpy.empty(buffer_bytes, dtype=numpy.uint8) \
+            if buffer_bytes else None
+        self.__buffer_used, self.__buffer_appends = 0, 0
+
+        # reserve disk space in extents starting at preallocate bytes and
+        # doubling each time, the slack is trimmed on close
+        self.__preallocate = preallocate \
+            if hasattr(os, "posix_fallocate") else None
+
+        # bounded queue for append_async, a full queue blocks the producer
+        self.__max_pending = max_pending
+
+        if multiprocess:
+            self.__init_multiprocess(delete_if_exists, buffer_bytes, preallocate)
+            return
+
+        if delete_if_exists:
+            if os.path.exists(filename):
                 os.unlink(filename)
-            else:
-                self.__init_from_file()
+            _remove_preallocated(filename)
+        elif os.path.exists(filename):
+            self.__init_from_file(header=header)
+
+    @property
+    def stats(self):
+        return self.__stats
+
+    @property
+    def header(self):
+        # (shape, fortran_order, dtype, header length) after close, pass it
+        # to a later NpyAppendArray of the same file to skip reading and
+        # validating the header
+        # other processes may have appended in multiprocess mode
+        if self.__is_init or self.__header_length is None or \
+        self.__multiprocess:
+            return None
+
+        return (
+            self.shape, self.fortran_order, self.dtype, self.__header_length
+        )
+
+    def __init_multiprocess(self, delete_if_exists, buffer_bytes, preallocate):
+        if fcntl is None:
+            raise ValueError("multiprocess mode requires fcntl")
+
+        if delete_if_exists or buffer_bytes or preallocate:
+            msg = (
+                "multiprocess mode cannot be combined with delete_if_exists, "
+                "buffer_bytes or preallocate"
+            )
+            raise ValueError(msg)
+
+        if not os.path.exists(self.filename):
+            msg = (
+                "multiprocess mode requires an existing file, please create "
+                "{} with a first append"
+            ).format(self.filename)
+            raise ValueError(msg)
+
+        self.__multiprocess = True
+        self.__reservations = os.open(
+            _reservations_filename(self.filename), os.O_RDWR | os.O_CREAT
+        )
+
+        # other processes may be writing right now, so the file can be
+        # longer than its header says
+        fd = self.__reservations
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        try:
+            self.__init_from_file(check_recovery=not any(
+                length for _, length in _read_reservations(fd)[1]
+            ))
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def __reserve_range(self, nbytes):
+        fd = self.__reservations
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        try:
+            reserved_end, slots = _read_reservations(fd)
+
+            # without pending ranges, the file may also have been appended
+            # to by other means since
+            if not any(length for _, length in slots):
+                reserved_end = max(
+                    reserved_end or 0, os.fstat(self.fp.fileno()).st_size
+                )
+                slots = []
+
+            index = next((
+                i for i, (_, length) in enumerate(slots) if length == 0
+            ), len(slots))
+
+            # in this order, a crash in between never leaves a pending range
+            # which others might have written to
+            os.pwrite(fd, struct.pack("<Q", reserved_end + nbytes), 0)
+            if not slots:
+                os.ftruncate(fd, 8)
+            os.pwrite(fd, struct.pack("<QQ", reserved_end, nbytes), 8 + 16 * index)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+        return reserved_end
+
+    def __release_range(self, offset, nbytes):
+        fd = self.__reservations
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        try:
+            reserved_end, slots = _read_reservations(fd)
+
+            index = slots.index((offset, nbytes))
+            os.pwrite(fd, struct.pack("<Q", 0), 16 + 16 * index)
+            slots[index] = (offset, 0)
 
-    def __init_from_file(self):
+            # the header only covers data up to the first pending range
+            committed_end = min(
+                [offset for offset, length in slots if length] +
+                [reserved_end]
+            )
+
+            fortran_order = self.fortran_order
+            row_shape = self.shape[:-1] if fortran_order else self.shape[1:]
+            row_bytes = prod(row_shape) * self.dtype.itemsize
+
+            if row_bytes:
+                count = (committed_end - self.__header_length) // row_bytes
+                self.shape = (*row_shape, count) if fortran_order \
+                    else (count, *row_shape)
+
+            self.__write_array_header()
+            self.fp.flush()
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def __append_shared(self, arrs):
+        # the data is written without holding any lock, only reserving and
+        # releasing byte ranges is serialized across processes
+        arrs = [self.__check_shape(numpy.asarray(arr)) for arr in arrs]
+        nbytes = sum(arr.size for arr in arrs) * self.dtype.itemsize
+
+        # an empty range could not be told apart from a released slot
+        if not nbytes:
+            return
+
+        with self.__lock:
+            offset = self.__reserve_range(nbytes)
+
+        stats = self.__stats
+        start = time.perf_counter() if stats is not None else None
+
+        position = offset
+        for data in self.__iter_bytes(arrs):
+            while data:
+                written = os.pwrite(self.fp.fileno(), data, position)
+                data, position = data[written:], position + written
+
+        if stats is not None:
+            stats.record("write", time.perf_counter() - start)
+
+        with self.__lock:
+            self.__release_range(offset, nbytes)
+
+    def __init_from_file(self, check_recovery=True, header=None):
         fp = open(self.filename, "rb+")
         self.fp = fp
 
+        # a cached header is only trusted if the file size still matches
+        if header is not None:
+            shape, fortran_order, dtype, header_length = header
+            size = os.fstat(fp.fileno()).st_size
+
+            if size == header_length + prod(shape) * dtype.itemsize:
+                self.shape, self.fortran_order, self.dtype = (
+                    shape, fortran_order, dtype
+                )
+                self.__header_length = header_length
+                self.__allocated_end = size
+                self.__header_time = time.monotonic()
+                self.__is_init = True
+                return
+
         hi = _HeaderInfo(fp)
         self.shape, self.fortran_order, self.dtype, self.__header_length = (
             hi.shape, hi.fortran_order, hi.dtype, hi.header_size
@@ -167,16 +866,26 @@ class NpyAppendArray:
             ).format(self.filename)
             raise ValueError(msg)
 
-        if hi.needs_recovery:
+        if check_recovery and hi.needs_recovery:
             msg = (
                 "cannot append to {}: file needs recovery, please call " 
                 "npy_append_array.recover"
             ).format(self.filename)
             raise ValueError(msg)
 
+        self.__allocated_end = hi.header_size + hi.data_length
+        self.__header_time = time.monotonic()
         self.__is_init = True
 
+        # the file does not need recovery, so a marker left behind by a
+        # crash after trimming is stale
+        if check_recovery:
+            _remove_preallocated(self.filename)
+
     def __write_array_header(self):
+        stats = self.__stats
+        start = time.perf_counter() if stats is not None else None
+
         fp = self.fp
         fp.seek(0, SEEK_SET)
 
@@ -186,51 +895,791 @@ class NpyAppendArray:
             "descr": format.dtype_to_descr(self.dtype)
         }, header_len = self.__header_length)
 
+        if stats is not None:
+            stats.record("header", time.perf_counter() - start)
+
+        self.__pending_appends, self.__pending_bytes = 0, 0
+        self.__header_time = time.monotonic()
+
+    def __commit(self, appends, nbytes):
+        # called with the lock held after data has been written, returns a
+        # sequence number to pass to __sync if the header policy asks for it
+        self.__pending_appends += appends
+        self.__pending_bytes += nbytes
+
+        policy = self.__header_policy
+
+        if not policy.is_due(
+            self.__pending_appends, time.monotonic() - self.__header_time,
+            self.__pending_bytes
+        ):
+            return None
+
+        # make the new header visible to readers right away
+        self.__write_array_header()
+        self.fp.flush()
+
+        if policy.sync is None:
+            return None
+
+        self.__commit_seq += 1
+
+        return self.__commit_seq
+
+    def __sync(self, seq):
+        # called without the lock held, so that appends can continue while
+        # the disk syncs; concurrent callers share a single sync
+        if seq is None:
+            return
+
+        sync = os.fdatasync if self.__header_policy.sync == "fdatasync" \
+            and hasattr(os, "fdatasync") else os.fsync
+        condition = self.__sync_condition
+
+        with condition:
+            while self.__synced_seq < seq:
+                if self.__is_syncing:
+                    condition.wait()
+                    continue
+
+                self.__is_syncing = True
+                target_seq = self.__commit_seq
+                condition.release()
+                try:
+                    self.__timed_sync(sync)
+                finally:
+                    condition.acquire()
+                    self.__is_syncing = False
+                    condition.notify_all()
+
+                self.__synced_seq = max(self.__synced_seq, target_seq)
+
+    def __timed_sync(self, sync):
+        stats = self.__stats
+        start = time.perf_counter() if stats is not None else None
+
+        sync(self.fp.fileno())
+
+        if stats is not None:
+            stats.record("sync", time.perf_counter() - start)
+
+    def __convert(self, block):
+        stats = self.__stats
+        start = time.perf_counter() if stats is not None else None
+
+        data = _as_bytes(block, self.dtype, self.fortran_order)
+
+        if stats is not None:
+            stats.record("convert", time.perf_counter() - start)
+
+        return data
+
+    def __convert_parallel(self, blocks):
+        # Numpy releases the GIL while casting and copying, so blocks are
+        # converted by a thread pool, up to convert_workers blocks ahead of
+        # the one being written
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(self.__convert_workers)
+
+        in_flight = deque()
+
+        for block in blocks:
+            in_flight.append(self.__executor.submit(self.__convert, block))
+            if len(in_flight) > self.__convert_workers:
+                yield in_flight.popleft().result()
+
+        while in_flight:
+            yield in_flight.popleft().result()
+
+    def __iter_bytes(self, arrs):
+        # the data of all arrays in the file's dtype and memory order,
+        # converted lazily block by block, see _blocks
+        for arr in arrs:
+            if self.__stats is not None:
+                self.__stats.record("append", arr.size * self.dtype.itemsize)
+
+            blocks = _blocks(
+                arr, self.dtype, self.fortran_order, self.__convert_bytes
+            )
+
+            if len(blocks) > 1 and self.__convert_workers:
+                yield from self.__convert_parallel(blocks)
+            else:
+                yield from map(self.__convert, blocks)
+
+    def __write(self, chunks):
+        # chunks are collected for writev, but converted blocks are not
+        # kept alive beyond about convert_bytes
+        stats = self.__stats
+        seconds = 0.0
+        batch, batch_bytes = [], 0
+        chunks = iter(chunks)
+
+        while True:
+            data = next(chunks, None)
+
+            if data is not None:
+                batch.append(data)
+                batch_bytes += data.nbytes
+
+                if self.__convert_bytes is None or \
+                batch_bytes < self.__convert_bytes:
+                    continue
+
+            if batch:
+                start = time.perf_counter() if stats is not None else None
+
+                if len(batch) == 1:
+                    self.fp.write(batch[0])
+                else:
+                    _write_all(self.fp, batch)
+
+                if stats is not None:
+                    seconds += time.perf_counter() - start
+
+                batch, batch_bytes = [], 0
+
+            if data is None:
+                break
+
+        if stats is not None:
+            stats.record("write", seconds)
+
+    def __data_end(self):
+        # end of the data on disk, which is not the end of the file if space
+        # has been preallocated
+        return self.__header_length + prod(self.shape) * \
+            self.dtype.itemsize - self.__buffer_used
+
+    def __mark_preallocated(self):
+        # before any zeros beyond the data reach the file, see
+        # _preallocated_filename
+        if not self.__preallocated:
+            open(_preallocated_filename(self.filename), "wb").close()
+            self.__preallocated = True
+
+    def __preallocate_to(self, end, min_bytes, extend=False):
+        self.__mark_preallocated()
+
+        # sized from the previous extent, not from the file, which may be
+        # huge already when opened
+        allocated_end = self.__allocated_end
+        extent_bytes = max(
+            min_bytes, min(2 * self.__extent_bytes, _PREALLOCATE_MAX_BYTES)
+        )
+        new_end = max(end, allocated_end + extent_bytes)
+
+        try:
+            os.posix_fallocate(
+                self.fp.fileno(), allocated_end, new_end - allocated_end
+            )
+        except (AttributeError, OSError):
+            # not supported by the file system, fall back to plain writes or,
+            # if the file must be extended, to a (possibly sparse) truncate
+            if not extend:
+                self.__preallocate = None
+                return
+
+            self.fp.truncate(new_end)
+
+        self.__allocated_end = new_end
+        self.__extent_bytes = new_end - allocated_end
+
+    def __seek_data_end(self, nbytes):
+        end = self.__data_end()
+
+        if self.__preallocate and end + nbytes > self.__allocated_end:
+            self.__preallocate_to(end + nbytes, self.__preallocate)
+
+        self.fp.seek(end, SEEK_SET)
+
+    def __flush_buffer(self):
+        if not self.__buffer_used:
+            return None
+
+        self.__seek_data_end(self.__buffer_used)
+        self.__write([memoryview(self.__buffer[:self.__buffer_used])])
+
+        appends, nbytes = self.__buffer_appends, self.__buffer_used
+        self.__buffer_used, self.__buffer_appends = 0, 0
+
+        return self.__commit(appends, nbytes)
+
+    def __check_shape(self, arr, shape=None, fortran_order=None):
+        # against the file's shape, or the one the file will be created with
+        if shape is None:
+            shape, fortran_order = self.shape, self.fortran_order
+
+        fortran_coeff = -1 if fortran_order else 1
+
+        # a single row (or record) lacks the append axis
+        if arr.ndim == len(shape) - 1:
+            arr = numpy.expand_dims(arr, -1 if fortran_order else 0)
+
+        if shape[::fortran_coeff][1:][::fortran_coeff] != \
+        arr.shape[::fortran_coeff][1:][::fortran_coeff]:
+            msg = "array shapes can only differ on append axis: " \
+            "0 if C order or -1 if fortran order"
+
+            raise ValueError(msg)
+
+        return arr
+
+    def __grow_shape(self, count):
+        shape = self.shape
+        self.shape = (*shape[:-1], shape[-1] + count) \
+            if self.fortran_order else (shape[0] + count, *shape[1:])
+
     def update_header(self):
+        # in multiprocess mode, the header is kept up to date on every append
+        if self.__reservations is not None:
+            return
+
         with self.__lock:
+            self.__flush_buffer()
             self.__write_array_header()
 
+    def flush(self):
+        with self.__lock:
+            if not self.__is_init or self.__reservations is not None:
+                return
+
+            self.__flush_buffer()
+            self.__write_array_header()
+            self.fp.flush()
+
+            if self.__mmap is not None:
+                self.__mmap.flush()
+
+            seq = None
+            if self.__header_policy.sync is not None:
+                self.__commit_seq += 1
+                seq = self.__commit_seq
+
+        self.__sync(seq)
+
+    def __create(self, arr):
+        with open(self.filename, 'wb') as fp:
+            write_array(fp, arr)
+        self.__init_from_file()
+
+        if self.__stats is not None:
+            self.__stats.record("append", numpy.asarray(arr).nbytes)
+
     def append(self, arr):
+        if self.__reservations is not None:
+            self.__append_shared([arr])
+            return
+
         with self.__lock:
-            if not self.__is_init:
-                with open(self.filename, 'wb') as fp:
-                    write_array(fp, arr)
-                self.__init_from_file()
+            seq = self.__append(arr)
+
+        self.__sync(seq)
+
+    def __append(self, arr):
+        if not self.__is_init:
+            self.__create(arr)
+            return None
+
+        arr = self.__check_shape(numpy.asarray(arr))
+        nbytes = arr.size * self.dtype.itemsize
+        chunks = self.__iter_bytes([arr])
+        buffer = self.__buffer
+
+        if buffer is not None and nbytes <= len(buffer):
+            seq = None
+            if self.__buffer_used + nbytes > len(buffer):
+                seq = self.__flush_buffer()
+
+            used = self.__buffer_used
+            for data in chunks:
+                buffer[used:used + data.nbytes] = data
+                used += data.nbytes
+            self.__buffer_used = used
+            self.__buffer_appends += 1
+            self.__grow_shape(arr.shape[-1 if self.fortran_order else 0])
+
+            return seq
+
+        self.__flush_buffer()
+
+        self.__seek_data_end(nbytes)
+        self.__write(chunks)
+
+        self.__grow_shape(arr.shape[-1 if self.fortran_order else 0])
+
+        return self.__commit(1, nbytes)
+
+    def extend(self, arrs):
+        arrs = [numpy.asarray(arr) for arr in arrs]
+
+        if self.__reservations is not None:
+            if arrs:
+                self.__append_shared(arrs)
+            return
+
+        with self.__lock:
+            seq = self.__extend(arrs)
+
+        self.__sync(seq)
+
+    def __extend(self, arrs):
+        if arrs and not self.__is_init:
+            # the rest of the batch is validated before the file is created
+            # from its first array
+            first = arrs[0]
+            fortran_order = format.header_data_from_array_1_0(first)[
+                "fortran_order"
+            ]
+            arrs = [first] + [
+                self.__check_shape(arr, first.shape, fortran_order)
+                for arr in arrs[1:]
+            ]
+            self.__create(arrs.pop(0))
+
+        if not arrs:
+            return None
+
+        # validate the whole batch before writing any of it
+        arrs = [self.__check_shape(arr) for arr in arrs]
+        nbytes = sum(arr.size for arr in arrs) * self.dtype.itemsize
+
+        self.__flush_buffer()
+
+        self.__seek_data_end(nbytes)
+        self.__write(self.__iter_bytes(arrs))
+
+        self.__grow_shape(sum(
+            arr.shape[-1 if self.fortran_order else 0] for arr in arrs
+        ))
+
+        return self.__commit(len(arrs), nbytes)
+
+    def __run_writer(self, pending):
+        while True:
+            item = pending.get()
+            if item is None:
                 return
 
-            shape = self.shape
-            fortran_order = self.fortran_order
-            fortran_coeff = -1 if fortran_order else 1
+            future, arr = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                self.append(arr)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+
+    def __stop_writer(self):
+        with self.__lock:
+            writer, self.__writer = self.__writer, None
+
+        if writer is not None:
+            thread, pending = writer
+            pending.put(None)
+            thread.join()
+
+    def append_async(self, arr):
+        # arr must not be modified until the returned future is done
+        with self.__lock:
+            if self.__writer is None:
+                pending = queue.Queue(maxsize=self.__max_pending)
+                thread = threading.Thread(
+                    target=self.__run_writer, args=(pending,), daemon=True
+                )
+                thread.start()
+                self.__writer = (thread, pending)
+
+            pending = self.__writer[1]
+
+        future = Future()
+        pending.put((future, arr))
+
+        return future
+
+    def __count(self, arr):
+        # rows of arr on the append axis, single rows lack that axis
+        if arr.ndim < len(self.shape):
+            return 1
+
+        return arr.shape[-1 if self.fortran_order else 0]
+
+    def append_stream(self, iterable, chunk_rows=65536):
+        # arrays are copied into a staging buffer of chunk_rows rows, in the
+        # file's dtype and memory order, which is written once full; arrays
+        # may be reused by the iterable right after they have been yielded,
+        # larger ones are appended directly. Returns the number of rows.
+        staging, used, rows = None, 0, 0
+
+        for arr in iterable:
+            arr = numpy.asarray(arr)
+
+            # the first array determines dtype, shape and memory order
+            if not self.__is_init:
+                self.append(arr)
+                rows += self.__count(arr)
+                continue
+
+            if staging is None:
+                _, row_bytes = self.__row_shape()
+                staging = numpy.empty(chunk_rows * row_bytes, numpy.uint8)
+
+            arr = self.__check_shape(arr)
+            nbytes = arr.size * self.dtype.itemsize
+
+            if used and (used + nbytes > len(staging) or not nbytes):
+                self.append_bytes(staging[:used])
+                used = 0
 
-            if shape[::fortran_coeff][1:][::fortran_coeff] != \
-            arr.shape[::fortran_coeff][1:][::fortran_coeff]:
-                msg = "array shapes can only differ on append axis: " \
-                "0 if C order or -1 if fortran order"
+            if nbytes > len(staging) or not nbytes:
+                self.append(arr)
+            else:
+                staging[used:used + nbytes] = _as_bytes(
+                    arr, self.dtype, self.fortran_order
+                )
+                used += nbytes
+
+            rows += self.__count(arr)
+
+        if used:
+            self.append_bytes(staging[:used])
+
+        return rows
+
+    def __row_shape(self):
+        if not self.__is_init:
+            msg = "cannot append bytes before the first append"
+            raise ValueError(msg)
+
+        row_shape = self.shape[:-1] if self.fortran_order else self.shape[1:]
+
+        return row_shape, prod(row_shape) * self.dtype.itemsize
+
+    def __from_bytes(self, buffer):
+        # a zero-copy array over raw bytes in the file's dtype and memory
+        # order, which must hold whole rows
+        data = memoryview(buffer).cast("B")
+        row_shape, row_bytes = self.__row_shape()
+        fortran_order = self.fortran_order
+
+        if not row_bytes or data.nbytes % row_bytes:
+            msg = "{} bytes are not a whole number of rows of {} bytes".format(
+                data.nbytes, row_bytes
+            )
+            raise ValueError(msg)
+
+        count = data.nbytes // row_bytes
+        shape = (*row_shape, count) if fortran_order else (count, *row_shape)
+
+        return numpy.frombuffer(data, dtype=self.dtype).reshape(
+            shape, order='F' if fortran_order else 'C'
+        )
+
+    def append_bytes(self, buffer):
+        self.append(self.__from_bytes(buffer))
+
+    def append_from_file(self, fileobj, chunk_bytes=None):
+        # reads raw rows from a blocking file object (e.g. a pipe or a
+        # socket's makefile) until end of file, through a single reused
+        # buffer of about chunk_bytes. Returns the number of rows.
+        _, row_bytes = self.__row_shape()
+
+        if not row_bytes:
+            raise ValueError("rows of {} have no data".format(self.filename))
+
+        chunk_bytes = chunk_bytes or self.__convert_bytes or 16 * 1024 ** 2
+        buffer = memoryview(bytearray(
+            max(1, chunk_bytes // row_bytes) * row_bytes
+        ))
+
+        readinto = getattr(fileobj, "readinto", None)
+        if readinto is None:
+            def readinto(view):
+                data = fileobj.read(len(view))
+                view[:len(data)] = data
+                return len(data)
+
+        used, rows = 0, 0
+
+        while True:
+            read = readinto(buffer[used:])
+            used += read or 0
+
+            if used < len(buffer) and read:
+                continue
+
+            # the buffer is full or the end of the file has been reached
+            complete = used // row_bytes * row_bytes
+            if complete:
+                self.append_bytes(buffer[:complete])
+                rows += complete // row_bytes
+
+            if not read:
+                break
 
-                raise ValueError(msg)
+            buffer[:used - complete] = buffer[complete:used]
+            used -= complete
 
-            self.fp.seek(0, SEEK_END)
+        if used % row_bytes:
+            msg = "end of file in the middle of a row, {} bytes left".format(
+                used % row_bytes
+            )
+            raise ValueError(msg)
+
+        return rows
+
+    def reserve(self, count):
+        with self.__lock:
+            arr, seq = self.__reserve(count)
+
+        self.__sync(seq)
+
+        return arr
+
+    def __reserve(self, count):
+        if self.__reservations is not None:
+            raise ValueError("reserve is not supported in multiprocess mode")
+
+        if not self.__is_init:
+            msg = "cannot reserve rows before the first append"
+            raise ValueError(msg)
+
+        self.__flush_buffer()
+
+        fortran_order = self.fortran_order
+        shape = (*self.shape[:-1], count) if fortran_order \
+            else (count, *self.shape[1:])
+        start = self.__data_end()
+        nbytes = prod(shape) * self.dtype.itemsize
+
+        if start + nbytes > self.__allocated_end:
+            self.__preallocate_to(
+                start + nbytes, self.__preallocate or _RESERVE_MIN_BYTES,
+                extend=True
+            )
+
+        # views handed out earlier keep their map alive, so the map is
+        # replaced rather than resized, which would fail with open views
+        if self.__mmap is None or len(self.__mmap) < start + nbytes:
+            self.fp.flush()
+            self.__retire_map(self.__mmap)
+            self.__mmap = mmap.mmap(self.fp.fileno(), self.__allocated_end)
+
+        self.__mapped_end = max(self.__mapped_end, start + nbytes)
+
+        arr = _map_array(self.__mmap, shape, self.dtype, start, fortran_order)
+
+        self.__grow_shape(count)
+
+        if self.__stats is not None:
+            self.__stats.record("append", nbytes)
+
+        return arr, self.__commit(1, nbytes)
+
+    def __len__(self):
+        if not self.__is_init:
+            return 0
+
+        return self.shape[-1 if self.fortran_order else 0]
+
+    def __bool__(self):
+        # an instance without rows is still an open writer, not a falsy one
+        return True
+
+    def view(self):
+        # a read-only array of all rows appended so far, memory mapped; the
+        # map is only replaced once the file has outgrown it, views handed
+        # out earlier keep their map alive
+        with self.__lock:
+            arr, seq = self.__view()
 
-            arr.astype(self.dtype, copy=False).flatten(
-                order='F' if self.fortran_order else 'C'
-            ).tofile(self.fp)
+        self.__sync(seq)
 
-            self.shape = (*shape[:-1], shape[-1] + arr.shape[-1]) \
-                if fortran_order else (shape[0] + arr.shape[0], *shape[1:])
+        return arr
 
-            if self.__rewrite_header_on_append:
-                self.__write_array_header()
+    def __view(self):
+        if not self.__is_init:
+            raise ValueError("cannot view rows before the first append")
+
+        seq = self.__flush_buffer()
+        self.fp.flush()
+
+        end = self.__data_end()
+
+        if self.__read_mmap is None or len(self.__read_mmap) < end:
+            self.__retire_map(self.__read_mmap)
+            self.__read_mmap = mmap.mmap(
+                self.fp.fileno(), os.fstat(self.fp.fileno()).st_size,
+                access=mmap.ACCESS_READ
+            )
+
+        self.__mapped_end = max(self.__mapped_end, end)
+
+        arr = _map_array(
+            self.__read_mmap, self.shape, self.dtype, self.__header_length,
+            self.fortran_order
+        )
+
+        return arr, seq
+
+    def __getitem__(self, key):
+        # keys index rows first, like len, also in Fortran order, where rows
+        # are along the last axis of the file
+        arr = self.view()
+
+        if self.fortran_order:
+            arr = numpy.moveaxis(arr, -1, 0)
+
+        return arr[key]
+
+    def __retire_map(self, map_):
+        # a replaced map is closed right away, unless views into it remain
+        if map_ is None:
+            return
+
+        try:
+            map_.close()
+        except BufferError:
+            self.__old_maps = [*self.__old_maps, map_]
+
+    def __live_mapped_end(self):
+        # closes all memory maps without views into them and returns the end
+        # of the data handed out through the others, or 0 if there are none;
+        # the file must never be cut below it, touching a view beyond the
+        # end of the file kills the process with SIGBUS
+        def close(map_):
+            try:
+                map_.close()
+                return True
+            except BufferError:
+                return False
+
+        if self.__mmap is not None:
+            self.__mmap.flush()
+            if close(self.__mmap):
+                self.__mmap = None
+
+        if self.__read_mmap is not None and close(self.__read_mmap):
+            self.__read_mmap = None
+
+        self.__old_maps = [
+            map_ for map_ in self.__old_maps if not close(map_)
+        ]
+
+        if self.__mmap is None and self.__read_mmap is None and \
+        not self.__old_maps:
+            self.__mapped_end = 0
+
+        return self.__mapped_end
+
+    def checkpoint(self):
+        # a token for rollback: the number of rows appended so far
+        with self.__lock:
+            return len(self)
+
+    def rollback(self, token):
+        self.truncate(token)
+
+    def truncate(self, count):
+        with self.__lock:
+            seq = self.__truncate(count)
+
+        self.__sync(seq)
+
+    def __truncate(self, count):
+        if self.__reservations is not None:
+            raise ValueError("truncate is not supported in multiprocess mode")
+
+        rows = len(self)
+
+        if not 0 <= count <= rows:
+            msg = "cannot truncate {} rows to {} rows".format(rows, count)
+            raise ValueError(msg)
+
+        if count == rows:
+            return None
+
+        self.__flush_buffer()
+
+        old_end = self.__data_end()
+        self.__grow_shape(count - rows)
+        end = self.__data_end()
+
+        # the data goes first, like in _truncate; views must not end up
+        # beyond the end of the file, so while they cover cut rows the file
+        # keeps its size and the rows are zeroed, like preallocated space
+        if self.__live_mapped_end() <= end:
+            self.fp.truncate(end)
+            self.__allocated_end = end
+        else:
+            self.__mark_preallocated()
+            self.fp.seek(end, SEEK_SET)
+            while self.fp.tell() < old_end:
+                self.fp.write(
+                    b'\0' * min(16 * 1024 ** 2, old_end - self.fp.tell())
+                )
+            self.__allocated_end = max(self.__allocated_end, old_end)
+
+        self.__write_array_header()
+        self.fp.flush()
+
+        if self.__header_policy.sync is None:
+            return None
+
+        self.__commit_seq += 1
+
+        return self.__commit_seq
+
+    async def append_asyncio(self, arr):
+        # putting into a full queue blocks, keep that off the event loop
+        future = await asyncio.get_running_loop().run_in_executor(
+            None, self.append_async, arr
+        )
+        await asyncio.wrap_future(future)
 
     def close(self):
+        self.__stop_writer()
+
         with self.__lock:
             if self.__is_init:
-                if not self.__rewrite_header_on_append:
+                self.__flush_buffer()
+
+                if self.__pending_appends:
                     self.__write_array_header()
 
+                # slack is trimmed, but not below rows still visible
+                # through views, see __live_mapped_end
+                end = max(self.__data_end(), self.__live_mapped_end())
+                self.__mmap, self.__read_mmap, self.__old_maps = \
+                    None, None, ()
+
+                if self.__allocated_end > end and \
+                self.__reservations is None:
+                    self.fp.truncate(end)
+
+                if self.__header_policy.sync is not None:
+                    self.fp.flush()
+                    self.__timed_sync(os.fsync)
+
                 self.fp.close()
 
+                # only once the file has been trimmed
+                if self.__preallocated and end == self.__data_end():
+                    _remove_preallocated(self.filename)
+                    self.__preallocated = False
+
                 self.__is_init = False
 
+            if self.__reservations is not None:
+                os.close(self.__reservations)
+                self.__reservations = None
+
+            if self.__executor is not None:
+                self.__executor.shutdown()
+                self.__executor = None
+
     def __del__(self):
         self.close()
 
@@ -0,0 +1,111 @@
+import os, threading
+from collections import OrderedDict
+from .npy_append_array import NpyAppendArray
+
+class NpyAppendArrayPool:
+    def __init__(self, max_open=256, delete_if_exists=False, **kwargs):
+        # keyword arguments are passed on to NpyAppendArray for each file;
+        # at most max_open files are kept open, the least recently used one
+        # is closed first
+        if max_open < 1:
+            raise ValueError("max_open must be at least 1")
+
+        self.__max_open = max_open
+        self.__delete_if_exists = delete_if_exists
+        self.__kwargs = kwargs
+        self.__lock = threading.Lock()
+
+        # open arrays by filename, least recently used first, and the number
+        # of appends using each of them right now, which must not be evicted
+        self.__open = OrderedDict()
+        self.__in_use = {}
+
+        # headers of closed files, so that reopening skips parsing them;
+        # files in here have been seen before and are never deleted again
+        self.__headers = {}
+
+    def __len__(self):
+        return len(self.__open)
+
+    def __evict(self):
+        # called with the lock held, files in use are skipped; if all of
+        # them are in use, max_open is exceeded for a while
+        for filename, npaa in self.__open.items():
+            if len(self.__open) < self.__max_open:
+                return
+
+            if self.__in_use.get(filename):
+                continue
+
+            self.__close(filename)
+            return self.__evict()
+
+    def __close(self, filename):
+        npaa = self.__open.pop(filename)
+        npaa.close()
+
+        if npaa.header is not None:
+            self.__headers[filename] = npaa.header
+
+    def __acquire(self, filename):
+        filename = os.fspath(filename)
+
+        with self.__lock:
+            npaa = self.__open.get(filename)
+
+            if npaa is None:
+                self.__evict()
+                delete_if_exists = self.__delete_if_exists and \
+                    filename not in self.__headers
+                npaa = NpyAppendArray(
+                    filename, delete_if_exists=delete_if_exists,
+                    header=self.__headers.pop(filename, None), **self.__kwargs
+                )
+                self.__open[filename] = npaa
+            else:
+                self.__open.move_to_end(filename)
+
+            self.__in_use[filename] = self.__in_use.get(filename, 0) + 1
+
+        return filename, npaa
+
+    def __release(self, filename):
+        with self.__lock:
+            self.__in_use[filename] -= 1
+            if not self.__in_use[filename]:
+                del self.__in_use[filename]
+
+    def append(self, filename, arr):
+        filename, npaa = self.__acquire(filename)
+        try:
+            npaa.append(arr)
+        finally:
+            self.__release(filename)
+
+    def extend(self, filename, arrs):
+        filename, npaa = self.__acquire(filename)
+        try:
+            npaa.extend(arrs)
+        finally:
+            self.__release(filename)
+
+    def flush(self):
+        with self.__lock:
+            npaas = list(self.__open.values())
+
+        for npaa in npaas:
+            npaa.flush()
+
+    def close(self):
+        with self.__lock:
+            for filename in list(self.__open):
+                self.__close(filename)
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,120 @@
+import os, numpy
+from .npy_append_array import NpyAppendArray, recover, _truncate
+
+class NpyAppendRaggedArray:
+    # Variable length records, stored as their concatenated values in one
+    # file and as cumulative offsets in another: record i consists of
+    # values[offsets[i]:offsets[i + 1]], offsets[0] is always 0. Values are
+    # always written before offsets, so offsets never point past the values.
+    __values, __offsets = None, None
+
+    def __init__(
+        self, values_filename, offsets_filename, delete_if_exists=False,
+        **kwargs
+    ):
+        # keyword arguments are passed on to both NpyAppendArray objects
+        if delete_if_exists:
+            for filename in [values_filename, offsets_filename]:
+                if os.path.exists(filename):
+                    os.unlink(filename)
+
+        self.__end = int(numpy.load(offsets_filename, mmap_mode="r")[-1]) \
+            if os.path.exists(offsets_filename) else 0
+        values_length = len(numpy.load(values_filename, mmap_mode="r")) \
+            if os.path.exists(values_filename) else 0
+
+        if values_length != self.__end:
+            msg = (
+                "cannot append to {} and {}: files need recovery, "
+                "please call npy_append_array.recover_ragged"
+            ).format(values_filename, offsets_filename)
+            raise ValueError(msg)
+
+        self.__values = NpyAppendArray(values_filename, **kwargs)
+        self.__offsets = NpyAppendArray(offsets_filename, **kwargs)
+
+        if not os.path.exists(offsets_filename):
+            self.__offsets.append(numpy.zeros(1, dtype=numpy.int64))
+
+    def __len__(self):
+        return self.__offsets.shape[0] - 1
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        # values are always appended to on axis 0
+        records = [numpy.ascontiguousarray(record) for record in records]
+
+        if not records:
+            return
+
+        lengths = numpy.array([len(record) for record in records])
+        offsets = self.__end + numpy.cumsum(lengths, dtype=numpy.int64)
+
+        self.__values.extend(records)
+        self.__offsets.append(offsets)
+        self.__end = int(offsets[-1])
+
+    def flush(self):
+        self.__values.flush()
+        self.__offsets.flush()
+
+    def close(self):
+        # values first, see above
+        if self.__values is not None:
+            self.__values.close()
+        if self.__offsets is not None:
+            self.__offsets.close()
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+def recover_ragged(values_filename, offsets_filename):
+    # recovers both files on their own, then drops records whose values are
+    # incomplete as well as values which no record points to
+    recover(values_filename)
+    recover(offsets_filename)
+
+    values_length = len(numpy.load(values_filename, mmap_mode="r"))
+    offsets = numpy.load(offsets_filename, mmap_mode="r")
+    count = int(numpy.searchsorted(offsets, values_length, side="right"))
+    end = int(offsets[count - 1]) if count else 0
+    del offsets
+
+    _truncate(offsets_filename, max(count, 1))
+    _truncate(values_filename, end)
+
+    if count == 0:
+        with NpyAppendArray(offsets_filename, delete_if_exists=True) as npaa:
+            npaa.append(numpy.zeros(1, dtype=numpy.int64))
+
+    return True
+
+class NpyAppendRaggedArrayReader:
+    def __init__(self, values_filename, offsets_filename):
+        self.values = numpy.load(values_filename, mmap_mode="r")
+        self.offsets = numpy.load(offsets_filename, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+
+        index = int(key) + (len(self) if key < 0 else 0)
+        if not 0 <= index < len(self):
+            raise IndexError("index {} is out of bounds".format(key))
+
+        return self.values[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
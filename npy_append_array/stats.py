@@ -0,0 +1,111 @@
+import time, threading
+from bisect import bisect_left
+
+# upper bounds of histogram buckets, in seconds (1 µs to about 4 s) and in
+# bytes (64 bytes to 1 GiB), each bucket 4 times as wide as the previous one
+_SECONDS_BOUNDS = tuple(1e-6 * 4 ** i for i in range(12))
+_BYTES_BOUNDS = tuple(64 * 4 ** i for i in range(13))
+
+_TIMINGS = ("lock_wait", "convert", "write", "header", "sync")
+
+class Histogram:
+    def __init__(self, bounds):
+        # bucket i counts values up to bounds[i], the last one all above
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count, self.sum = 0, 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        return {
+            "count": self.count, "sum": self.sum,
+            "buckets": [
+                [bound, count] for bound, count in zip(
+                    (*self.bounds, float("inf")), self.counts
+                )
+            ],
+        }
+
+class AppendStats:
+    # Events passed to record and to callbacks, as (event, value):
+    #
+    # - "append": bytes of one appended array (or reserved rows)
+    # - "lock_wait", "convert", "write", "header", "sync": seconds spent
+    #   waiting for the lock, converting arrays to the file's dtype and
+    #   memory order, writing data, rewriting the header and syncing
+    #
+    # One instance may be shared by several NpyAppendArray instances.
+    def __init__(self, callbacks=()):
+        self.__lock = threading.Lock()
+        self.__callbacks = list(callbacks)
+        self.reset()
+
+    def add_callback(self, callback):
+        # callbacks are called in the appending thread, keep them fast
+        self.__callbacks.append(callback)
+
+    def reset(self):
+        with self.__lock:
+            self.appends, self.bytes_appended = 0, 0
+            self.header_rewrites, self.syncs = 0, 0
+            self.append_bytes = Histogram(_BYTES_BOUNDS)
+            self.timings = {
+                name: Histogram(_SECONDS_BOUNDS) for name in _TIMINGS
+            }
+
+    def record(self, event, value):
+        with self.__lock:
+            if event == "append":
+                self.appends += 1
+                self.bytes_appended += value
+                self.append_bytes.observe(value)
+            else:
+                if event == "header":
+                    self.header_rewrites += 1
+                elif event == "sync":
+                    self.syncs += 1
+                self.timings[event].observe(value)
+
+        for callback in self.__callbacks:
+            callback(event, value)
+
+    def snapshot(self):
+        # plain dicts and lists, e.g. for json.dumps
+        with self.__lock:
+            return {
+                "appends": self.appends,
+                "bytes_appended": self.bytes_appended,
+                "header_rewrites": self.header_rewrites,
+                "syncs": self.syncs,
+                "append_bytes": self.append_bytes.to_dict(),
+                "timings": {
+                    name: histogram.to_dict()
+                    for name, histogram in self.timings.items()
+                },
+            }
+
+class _TimedLock:
+    # wraps the lock of an NpyAppendArray with stats, so that instances
+    # without stats use the plain lock and pay nothing
+    def __init__(self, lock, stats):
+        self.__lock, self.__stats = lock, stats
+
+    def acquire(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.__lock.acquire(*args, **kwargs)
+        self.__stats.record("lock_wait", time.perf_counter() - start)
+        return result
+
+    def release(self):
+        self.__lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
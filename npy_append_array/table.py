@@ -0,0 +1,265 @@
+import os, json, time, threading, numpy
+from numpy.lib import format
+from .format import _read_array_header
+from .npy_append_array import (
+    NpyAppendArray, HeaderPolicy, recover, _truncate
+)
+
+_TABLE_FILENAME = "table.json"
+
+def _column_filename(dirname, column):
+    return os.path.join(dirname, column + ".npy")
+
+def _read_columns(dirname):
+    with open(os.path.join(dirname, _TABLE_FILENAME)) as fp:
+        return json.load(fp)["columns"]
+
+def _write_columns(dirname, columns):
+    # write and rename, so that readers never see a partial file
+    filename = os.path.join(dirname, _TABLE_FILENAME)
+    with open(filename + ".tmp", "w") as fp:
+        json.dump({"columns": columns}, fp)
+    os.replace(filename + ".tmp", filename)
+
+def _read_header(filename):
+    with open(filename, "rb") as fp:
+        version = format.read_magic(fp)
+        return _read_array_header(fp, version)
+
+def _as_columns(batch):
+    # a dict of arrays or a structured array, one column per field
+    if isinstance(batch, numpy.ndarray) and batch.dtype.names:
+        return {name: batch[name] for name in batch.dtype.names}
+
+    return {name: numpy.asarray(arr) for name, arr in batch.items()}
+
+class NpyAppendTable:
+    # A table stored as one .npy file per column in a directory, plus the
+    # list of columns in table.json, written once all column files exist.
+    # Each batch is written to all columns before any header is updated,
+    # so after a crash recover_table can cut all columns to the rows that
+    # are complete in every one of them.
+    __npaas = None
+
+    def __init__(
+        self, dirname, delete_if_exists=False, header_policy=None, **kwargs
+    ):
+        # keyword arguments are passed on to NpyAppendArray for each column,
+        # header_policy applies to the table as a whole
+        self.dirname = dirname
+        self.__header_policy = HeaderPolicy() if header_policy is None \
+            else header_policy
+        self.__kwargs = kwargs
+        self.__lock = threading.Lock()
+        self.__pending_appends, self.__pending_bytes = 0, 0
+        self.__header_time = time.monotonic()
+        self.__npaas = {}
+
+        os.makedirs(dirname, exist_ok=True)
+
+        if not os.path.exists(os.path.join(dirname, _TABLE_FILENAME)):
+            return
+
+        if delete_if_exists:
+            for column in _read_columns(dirname):
+                filename = _column_filename(dirname, column)
+                if os.path.exists(filename):
+                    os.unlink(filename)
+            os.unlink(os.path.join(dirname, _TABLE_FILENAME))
+            return
+
+        try:
+            for column in _read_columns(dirname):
+                self.__npaas[column] = self.__open(column)
+        except ValueError:
+            # e.g. a column with data beyond its header after a crash
+            self.close()
+            raise ValueError(self.__recovery_message())
+
+        if len({npaa.shape[0] for npaa in self.__npaas.values()}) > 1:
+            self.close()
+            raise ValueError(self.__recovery_message())
+
+    def __recovery_message(self):
+        return (
+            "cannot append to {}: table needs recovery, please call "
+            "npy_append_array.recover_table"
+        ).format(self.dirname)
+
+    def __open(self, column, delete_if_exists=False):
+        # the table decides when headers are written, see __commit
+        return NpyAppendArray(
+            _column_filename(self.dirname, column),
+            delete_if_exists=delete_if_exists,
+            header_policy=HeaderPolicy(
+                every_appends=None, sync=self.__header_policy.sync
+            ), **self.__kwargs
+        )
+
+    @property
+    def columns(self):
+        return list(self.__npaas)
+
+    def __len__(self):
+        if not self.__npaas:
+            return 0
+
+        return next(iter(self.__npaas.values())).shape[0]
+
+    def __check(self, columns):
+        if self.__npaas and set(columns) != set(self.__npaas):
+            msg = "batch columns {} do not match table columns {}".format(
+                sorted(columns), sorted(self.__npaas)
+            )
+            raise ValueError(msg)
+
+        for column, arr in columns.items():
+            if not column or column.startswith(".") or \
+            os.sep in column or (os.altsep and os.altsep in column):
+                raise ValueError("invalid column name {!r}".format(column))
+
+            if arr.ndim == 0:
+                raise ValueError("column {!r} has no rows".format(column))
+
+            npaa = self.__npaas.get(column)
+            if npaa is not None and arr.shape[1:] != npaa.shape[1:]:
+                msg = "column {!r}: array shapes can only differ on " \
+                    "append axis 0".format(column)
+                raise ValueError(msg)
+
+        if len({len(arr) for arr in columns.values()}) > 1:
+            raise ValueError("all columns must have the same number of rows")
+
+    def append(self, batch):
+        columns = _as_columns(batch)
+
+        with self.__lock:
+            self.__check(columns)
+
+            if not self.__npaas:
+                self.__create(columns)
+            else:
+                # all columns are converted before any is written, so that a
+                # failing conversion cannot leave columns of different length
+                columns = {
+                    column: arr.astype(self.__npaas[column].dtype, copy=False)
+                    for column, arr in columns.items()
+                }
+                for column, arr in columns.items():
+                    self.__npaas[column].append(arr)
+
+            self.__commit(sum(arr.nbytes for arr in columns.values()))
+
+    def __create(self, columns):
+        # columns are appended to on axis 0, whatever the memory order of
+        # the first batch
+        for column, arr in columns.items():
+            npaa = self.__open(column, delete_if_exists=True)
+            npaa.append(numpy.ascontiguousarray(arr))
+            self.__npaas[column] = npaa
+
+        _write_columns(self.dirname, list(columns))
+
+    def __commit(self, nbytes):
+        # one header update for all columns, after all data is written
+        self.__pending_appends += 1
+        self.__pending_bytes += nbytes
+
+        if self.__header_policy.is_due(
+            self.__pending_appends, time.monotonic() - self.__header_time,
+            self.__pending_bytes
+        ):
+            self.__flush()
+
+    def __flush(self):
+        for npaa in self.__npaas.values():
+            npaa.flush()
+
+        self.__pending_appends, self.__pending_bytes = 0, 0
+        self.__header_time = time.monotonic()
+
+    def flush(self):
+        with self.__lock:
+            self.__flush()
+
+    def close(self):
+        if self.__npaas is not None:
+            for npaa in self.__npaas.values():
+                npaa.close()
+            self.__npaas = None
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+def recover_table(dirname, zerofill_incomplete=False):
+    # recovers each column on its own, then cuts all of them to the number
+    # of rows they have in common
+    if not os.path.exists(os.path.join(dirname, _TABLE_FILENAME)):
+        return True
+
+    filenames = [
+        _column_filename(dirname, column) for column in _read_columns(dirname)
+    ]
+
+    for filename in filenames:
+        recover(filename, zerofill_incomplete=zerofill_incomplete)
+
+    count = min(_read_header(filename)[0][0] for filename in filenames)
+
+    for filename in filenames:
+        _truncate(filename, count)
+
+    return True
+
+class NpyAppendTableReader:
+    def __init__(self, dirname):
+        # only headers are read here, columns are memory mapped lazily
+        self.dirname = dirname
+        self.columns = _read_columns(dirname)
+        self.__arrays = {}
+
+        headers = {
+            column: _read_header(_column_filename(dirname, column))
+            for column in self.columns
+        }
+        self.dtypes = {
+            column: dtype for column, (_, _, dtype) in headers.items()
+        }
+
+        # a writer may be between header updates of different columns
+        self.__length = min(
+            (shape[0] for shape, _, _ in headers.values()), default=0
+        )
+
+    def __len__(self):
+        return self.__length
+
+    def __column(self, column):
+        if column not in self.dtypes:
+            raise KeyError(column)
+
+        arr = self.__arrays.get(column)
+
+        if arr is None:
+            arr = numpy.load(
+                _column_filename(self.dirname, column), mmap_mode="r"
+            )[:self.__length]
+            self.__arrays[column] = arr
+
+        return arr
+
+    def __getitem__(self, key):
+        # a column by name, or a dict of columns for a list of names
+        if isinstance(key, str):
+            return self.__column(key)
+
+        return {column: self.__column(column) for column in key}
+
+    def __contains__(self, column):
+        return column in self.dtypes
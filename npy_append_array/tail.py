@@ -0,0 +1,172 @@
+import os, re, mmap, time, numpy
+from math import prod
+from numpy.lib import format
+from .format import _read_array_header
+
+_SHAPE_PATTERN = re.compile(rb"'shape': \(([^)]*)\)")
+
+class NpyTailReader:
+    fp = None
+
+    def __init__(self, filename, watch="header", poll_interval=0.1):
+        # watch="header" only returns rows covered by the header, which is
+        # what NpyAppendArray has committed; watch="size" also returns
+        # complete rows beyond it, for writers with stale headers, up to the
+        # first one consisting of zeros only, which may as well be space
+        # preallocated or reserved by the writer
+        if watch not in ("header", "size"):
+            raise ValueError("watch must be 'header' or 'size'")
+
+        self.filename = filename
+        self.__watch = watch
+        self.__poll_interval = poll_interval
+
+        fp = open(filename, "rb")
+        self.fp = fp
+
+        version = format.read_magic(fp)
+        shape, fortran_order, dtype = _read_array_header(fp, version)
+
+        if dtype.hasobject:
+            raise ValueError("Object arrays cannot be tailed")
+
+        self.shape, self.fortran_order, self.dtype = (
+            shape, fortran_order, dtype
+        )
+        self.__header_size = fp.tell()
+        self.__row_shape = shape[:-1] if fortran_order else shape[1:]
+        self.__row_bytes = prod(self.__row_shape) * dtype.itemsize
+
+        if not self.__row_bytes:
+            raise ValueError("rows of {} have no data".format(filename))
+
+        # index of the next row to hand out and the current memory map
+        self.position = 0
+        self.__mmap, self.__mmap_offset = None, 0
+
+    def __available_rows(self):
+        size = os.fstat(self.fp.fileno()).st_size
+        rows = (size - self.__header_size) // self.__row_bytes
+
+        # only the growth axis changes, no need for a full header parse
+        match = _SHAPE_PATTERN.search(self.__read(0, self.__header_size))
+
+        # the header may be in the middle of being rewritten
+        try:
+            shape = [int(x) for x in match.group(1).split(b",") if x.strip()]
+        except (AttributeError, ValueError):
+            return self.position
+
+        header_rows = min(rows, shape[-1 if self.fortran_order else 0])
+
+        if self.__watch == "header":
+            return header_rows
+
+        return self.__nonzero_rows(max(self.position, header_rows), rows)
+
+    def __nonzero_rows(self, start, stop):
+        # returns the first row in [start, stop) which has zeros only, or
+        # stop; read block by block instead of through the memory map, the
+        # writer may cut off the zeros at any time
+        block_rows = max(1, 1024 ** 2 // self.__row_bytes)
+
+        for block_start in range(start, stop, block_rows):
+            data = self.__read(
+                self.__header_size + block_start * self.__row_bytes,
+                min(block_rows, stop - block_start) * self.__row_bytes
+            )
+            data = numpy.frombuffer(
+                data, dtype=numpy.uint8,
+                count=len(data) // self.__row_bytes * self.__row_bytes
+            ).reshape(-1, self.__row_bytes)
+            zero_rows = numpy.flatnonzero(~data.any(axis=1))
+
+            if len(zero_rows):
+                return block_start + int(zero_rows[0])
+
+            if len(data) < block_rows:
+                return block_start + len(data)
+
+        return stop
+
+    def __read(self, offset, size):
+        if hasattr(os, "pread"):
+            return os.pread(self.fp.fileno(), size, offset)
+
+        self.fp.seek(offset)
+        return self.fp.read(size)
+
+    def __map(self, start, end):
+        # map from the page containing start, old maps stay alive as long
+        # as views into them exist
+        offset = start // mmap.ALLOCATIONGRANULARITY * \
+            mmap.ALLOCATIONGRANULARITY
+
+        if self.__mmap is None or offset < self.__mmap_offset or \
+        end > self.__mmap_offset + len(self.__mmap):
+            self.__mmap = mmap.mmap(
+                self.fp.fileno(), os.fstat(self.fp.fileno()).st_size - offset,
+                access=mmap.ACCESS_READ, offset=offset
+            )
+            self.__mmap_offset = offset
+
+        return self.__mmap
+
+    def poll(self):
+        rows = self.__available_rows()
+        count = max(0, rows - self.position)
+
+        if self.fortran_order:
+            shape = (*self.__row_shape, count)
+        else:
+            shape = (count, *self.__row_shape)
+
+        if not count:
+            return numpy.empty(shape, dtype=self.dtype)
+
+        start = self.__header_size + self.position * self.__row_bytes
+        end = start + count * self.__row_bytes
+        buffer = self.__map(start, end)
+
+        arr = numpy.ndarray(
+            shape, dtype=self.dtype, buffer=buffer,
+            offset=start - self.__mmap_offset,
+            order='F' if self.fortran_order else 'C'
+        )
+        self.position = rows
+
+        return arr
+
+    def follow(self, timeout=None):
+        # yields new rows as they arrive, stops after timeout seconds
+        # without new rows if a timeout is given
+        last_data = time.monotonic()
+
+        while True:
+            arr = self.poll()
+
+            if arr.size:
+                last_data = time.monotonic()
+                yield arr
+                continue
+
+            if timeout is not None and \
+            time.monotonic() - last_data >= timeout:
+                return
+
+            time.sleep(self.__poll_interval)
+
+    def close(self):
+        if self.fp is not None:
+            self.__mmap = None
+            self.fp.close()
+            self.fp = None
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
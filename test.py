@@ -1,4 +1,4 @@
-import os, io, npy_append_array, threading
+import os, io, npy_append_array, threading, asyncio
 import numpy as np
 from itertools import product
 from pathlib import Path
@@ -79,6 +79,47 @@ for fortran_order in [False, True]:
             arr.flatten(order=order)[:data_length] == arr2
         )[:half_array_size if zerofill_incomplete else data_length])
 
+# ensure_appendable in place without support for inserting blocks
+insert_range = npy_append_array.npy_append_array._insert_range
+npy_append_array.npy_append_array._insert_range = lambda fd, length: False
+try:
+    arr = np.arange(3000, dtype=np.uint16).reshape(-1, 3)
+    # a header without room to grow, as written by old numpy versions, and
+    # a field name for which 64 byte alignment leaves no room either
+    for length in range(1, 64):
+        dtype = np.dtype([('_' * length, np.uint16)])
+        header = repr({
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False, 'shape': arr.shape
+        }).encode('latin1')
+        header += b' ' * (-(len(header) + 11) % 64) + b'\n'
+        with open(tmpfile, 'wb') as fp:
+            fp.write(b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little'))
+            fp.write(header + arr.astype(dtype).tobytes())
+        if not npy_append_array.is_appendable(tmpfile):
+            break
+    assert not npy_append_array.is_appendable(tmpfile)
+    npy_append_array.ensure_appendable(tmpfile, inplace=True)
+    assert npy_append_array.is_appendable(tmpfile)
+    assert np.all(np.load(tmpfile).astype(np.uint16) == arr)
+finally:
+    npy_append_array.npy_append_array._insert_range = insert_range
+
+# headers padded to a given length
+from npy_append_array.format import _write_array_header
+arr = np.arange(12, dtype='<f8').reshape(4, 3)
+for header_len in [128, 192, 4096, 9984]:
+    with open(tmpfile, 'wb') as fp:
+        _write_array_header(fp, {
+            'shape': arr.shape, 'fortran_order': False, 'descr': '<f8'
+        }, header_len=header_len)
+        fp.write(arr.tobytes())
+    assert tmpfile.stat().st_size == header_len + arr.nbytes
+    assert np.array_equal(np.load(tmpfile), arr)
+    with NpyAppendArray(tmpfile) as npaa:
+        npaa.append(arr)
+    assert np.array_equal(np.load(tmpfile), np.concatenate([arr, arr]))
+
 tmpfile.unlink()
 
 # test regular append for C order and Fortran arrays
@@ -144,4 +185,1113 @@ for i in range(40):
     with NpyAppendArray(tmpfile) as npaa:
         npaa.append(np.zeros((50000, 76, 3)))
 
-tmpfile.unlink(missing_ok=True)
\ No newline at end of file
+tmpfile.unlink(missing_ok=True)
+# non-contiguous and dtype-converting appends
+arr1 = np.arange(60, dtype=np.float32).reshape(10, 6)
+arr2 = np.arange(120, dtype=np.int64).reshape(10, 12)[:, ::2]
+
+with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+    npaa.append(arr1)
+    npaa.append(arr2)
+    npaa.append(np.asfortranarray(arr2))
+
+assert np.all(np.load(tmpfile) == np.concatenate([arr1, arr2, arr2]))
+
+tmpfile.unlink(missing_ok=True)
+
+# appends to different files in parallel, with per-file and shared locks
+for lock in [None, threading.Lock()]:
+    filenames = [tmpfile.with_name('tmp_{}.npy'.format(i)) for i in range(4)]
+    npaas = [
+        NpyAppendArray(filename, delete_if_exists=True, lock=lock)
+        for filename in filenames
+    ]
+    threads = [
+        threading.Thread(target=npaa.append, args=(np.arange(12).reshape(4, 3),))
+        for npaa in npaas for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for npaa, filename in zip(npaas, filenames):
+        npaa.close()
+        assert np.load(filename).shape == (20, 3)
+        filename.unlink()
+
+# buffered appends, including single rows and structured records
+for rewrite_header_on_append in [False, True]:
+    dtype = np.dtype([('a', np.int32), ('b', np.float64)])
+    records = np.zeros(100, dtype=dtype)
+    records['a'] = np.arange(100)
+
+    with NpyAppendArray(
+        tmpfile, delete_if_exists=True, buffer_bytes=256,
+        rewrite_header_on_append=rewrite_header_on_append
+    ) as npaa:
+        npaa.append(records[:1])
+        for record in records[1:50]:
+            npaa.append(record)
+        npaa.append(records[50:])
+        assert npaa.shape == (100,)
+        npaa.flush()
+        assert np.all(np.load(tmpfile) == records)
+
+    assert np.all(np.load(tmpfile) == records)
+
+with NpyAppendArray(tmpfile, delete_if_exists=True, buffer_bytes=1024) as npaa:
+    npaa.append(np.zeros((1, 3)))
+    for i in range(10):
+        npaa.append(np.full(3, i))
+
+assert np.all(np.load(tmpfile)[1:, 0] == np.arange(10))
+
+tmpfile.unlink(missing_ok=True)
+
+# asynchronous appends via futures and asyncio
+with NpyAppendArray(tmpfile, delete_if_exists=True, max_pending=2) as npaa:
+    futures = [npaa.append_async(np.full((2, 3), i)) for i in range(10)]
+    for future in futures:
+        future.result()
+
+    try:
+        npaa.append_async(np.zeros((2, 4))).result()
+        assert False
+    except ValueError:
+        pass
+
+    async def produce():
+        await asyncio.gather(*[
+            npaa.append_asyncio(np.full((2, 3), i)) for i in range(10, 20)
+        ])
+
+    asyncio.run(produce())
+
+arr = np.load(tmpfile)
+assert arr.shape == (40, 3)
+assert np.all(arr[:20:2, 0] == np.arange(10))
+assert np.all(np.sort(arr[20::2, 0]) == np.arange(10, 20))
+
+tmpfile.unlink(missing_ok=True)
+
+# batched appends with extend
+arrs = [np.full((i % 3 + 1, 4), i, dtype=np.int16) for i in range(2000)]
+
+with NpyAppendArray(tmpfile, delete_if_exists=True, buffer_bytes=64) as npaa:
+    npaa.extend(arrs[:1000])
+    npaa.append(arrs[1000])
+    npaa.extend(iter(arrs[1001:]))
+    npaa.extend([])
+
+    try:
+        npaa.extend([arrs[0], np.zeros((1, 5))])
+        assert False
+    except ValueError:
+        pass
+
+assert np.all(np.load(tmpfile) == np.concatenate(arrs))
+
+# a bad batch does not create the file either
+tmpfile.unlink(missing_ok=True)
+with NpyAppendArray(tmpfile) as npaa:
+    for batch in [
+        [arrs[0], np.zeros((1, 5))],
+        [np.asfortranarray(np.zeros((4, 2))), np.zeros((2, 4))]
+    ]:
+        try:
+            npaa.extend(batch)
+            assert False
+        except ValueError:
+            pass
+    assert not tmpfile.exists()
+    npaa.extend([arrs[0], arrs[1][0]])
+assert np.all(np.load(tmpfile) == np.concatenate(arrs[:2])[:2])
+
+tmpfile.unlink(missing_ok=True)
+
+# header rewrite and sync policies
+from npy_append_array import HeaderPolicy
+
+with NpyAppendArray(
+    tmpfile, delete_if_exists=True,
+    header_policy=HeaderPolicy(every_appends=3)
+) as npaa:
+    for i in range(7):
+        npaa.append(np.full((1, 2), i))
+        assert np.load(tmpfile).shape == (1 + (i // 3) * 3, 2)
+
+assert np.load(tmpfile).shape == (7, 2)
+
+with NpyAppendArray(
+    tmpfile, delete_if_exists=True,
+    header_policy=HeaderPolicy(every_bytes=64)
+) as npaa:
+    npaa.append(np.zeros((1, 2)))
+    npaa.append(np.zeros((3, 2)))
+    assert np.load(tmpfile).shape == (1, 2)
+    npaa.append(np.zeros((1, 2)))
+    assert np.load(tmpfile).shape == (5, 2)
+
+# a time trigger alone does not rewrite the header on every append
+with NpyAppendArray(
+    tmpfile, delete_if_exists=True,
+    header_policy=HeaderPolicy(every_seconds=60)
+) as npaa:
+    for i in range(5):
+        npaa.append(np.zeros((1, 2)))
+        assert np.load(tmpfile).shape == (1, 2)
+assert np.load(tmpfile).shape == (5, 2)
+assert HeaderPolicy().every_appends == 1
+assert HeaderPolicy(every_appends=None).every_appends is None
+
+for sync in ["fsync", "fdatasync"]:
+    with NpyAppendArray(
+        tmpfile, delete_if_exists=True,
+        header_policy=HeaderPolicy(every_seconds=0, sync=sync)
+    ) as npaa:
+        npaa.append(np.zeros((1, 2)))
+        threads = [
+            threading.Thread(target=npaa.append, args=(np.ones((1, 2)),))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert np.load(tmpfile).shape == (9, 2)
+
+try:
+    HeaderPolicy(sync="always")
+    assert False
+except ValueError:
+    pass
+
+tmpfile.unlink(missing_ok=True)
+
+# preallocated growth, slack is trimmed on close and by recover
+import shutil
+
+crashfile = tmpfile.with_name('crash.npy')
+marker = lambda filename: Path(str(filename) + '.preallocated')
+
+def crash(npaa, filename):
+    # a copy of the file and its marker, as a crash would leave them
+    npaa.fp.flush()
+    shutil.copy(npaa.filename, filename)
+    marker(filename).unlink(missing_ok=True)
+    if marker(npaa.filename).exists():
+        shutil.copy(marker(npaa.filename), marker(filename))
+
+for rewrite_header_on_append in [True, False]:
+    with NpyAppendArray(
+        tmpfile, delete_if_exists=True, preallocate=4096,
+        rewrite_header_on_append=rewrite_header_on_append
+    ) as npaa:
+        for i in range(100):
+            npaa.append(np.full((1, 3), i + 1, dtype=np.int32))
+        npaa.append(np.zeros((1, 3), dtype=np.int32))
+
+        npaa.flush()
+        crash(npaa, crashfile)
+
+    assert not marker(tmpfile).exists()
+    arr = np.load(tmpfile)
+    assert tmpfile.stat().st_size == 128 + arr.nbytes
+    assert arr.shape == (101, 3) and np.all(arr[:100, 0] == np.arange(1, 101))
+
+    if not hasattr(os, 'posix_fallocate'):
+        continue
+
+    assert crashfile.stat().st_size > tmpfile.stat().st_size
+    assert npy_append_array.npy_append_array.needs_recovery(crashfile)
+
+    # without the marker, zeros beyond the header's shape are only dropped
+    # on request, with it they always are
+    for trim_zero_tail in [False, True]:
+        shutil.copy(crashfile, tmpfile)
+        npy_append_array.recover(tmpfile, trim_zero_tail=trim_zero_tail)
+        assert (np.load(tmpfile).shape[0] == 101) == trim_zero_tail
+    npy_append_array.recover(crashfile)
+    assert np.all(np.load(crashfile) == arr)
+    assert not marker(crashfile).exists()
+
+# a writer with a stale header and space preallocated ahead, after a crash
+with NpyAppendArray(
+    tmpfile, delete_if_exists=True, preallocate=4096,
+    rewrite_header_on_append=False
+) as npaa:
+    npaa.append(np.ones((1, 3), dtype=np.int32))
+    for i in range(5):
+        npaa.append(np.full((1, 3), i + 2, dtype=np.int32))
+    crash(npaa, crashfile)
+npy_append_array.recover(crashfile)
+assert np.array_equal(
+    np.load(crashfile)[:, 0], [1, 2, 3, 4, 5, 6]
+)
+
+# extents start at preallocate bytes and double, whatever the file's size
+if hasattr(os, 'posix_fallocate'):
+    np.save(tmpfile, np.zeros((1 << 16, 4)))
+    with NpyAppendArray(tmpfile, preallocate=4096) as npaa:
+        size = tmpfile.stat().st_size
+        sizes = []
+        for i in range(400):
+            npaa.append(np.ones((1, 4)))
+            sizes.append(os.fstat(npaa.fp.fileno()).st_size - size)
+        assert sorted(set(sizes)) == [4096, 3 * 4096, 7 * 4096]
+
+# zero rows beyond a stale header are data if nothing was preallocated
+with NpyAppendArray(
+    tmpfile, delete_if_exists=True, rewrite_header_on_append=False
+) as npaa:
+    npaa.append(np.ones((2, 3)))
+    npaa.update_header()
+    npaa.append(np.zeros((5, 3)))
+    crash(npaa, crashfile)
+assert not marker(crashfile).exists()
+npy_append_array.recover(crashfile)
+assert np.load(crashfile).shape == (7, 3)
+
+crashfile.unlink(missing_ok=True)
+tmpfile.unlink(missing_ok=True)
+
+# filling reserved rows in place through a memory map
+for fortran_order in [False, True]:
+    first = np.zeros((3, 2, 1), order='F') if fortran_order \
+        else np.zeros((1, 2, 3))
+
+    with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+        npaa.append(first)
+        views = []
+        for i in range(1, 2000):
+            view = npaa.reserve(i % 5)
+            view[...] = i
+            views.append(view)
+        npaa.append(first + 1)
+        view = npaa.reserve(2)
+        view[...] = 7
+        shape = npaa.shape
+
+    arr = np.load(tmpfile)
+    assert arr.shape == shape
+    assert tmpfile.stat().st_size == 128 + arr.nbytes
+    arr = np.moveaxis(arr, -1, 0) if fortran_order else arr
+    assert np.all(arr[-2:] == 7) and np.all(arr[-3] == 1)
+    assert np.all(arr[1:-3, 0, 0] == np.repeat(
+        np.arange(1, 2000), np.arange(1, 2000) % 5
+    ))
+    del views, view
+
+tmpfile.unlink(missing_ok=True)
+
+# appends from several processes to one file
+import subprocess, sys
+
+worker = '''
+import sys, numpy as np
+from npy_append_array import NpyAppendArray
+with NpyAppendArray(sys.argv[1], multiprocess=True) as npaa:
+    for i in range(50):
+        if i % 2:
+            npaa.append(np.full((i % 7 + 1, 3), int(sys.argv[2])))
+        else:
+            npaa.extend([np.full((1, 3), int(sys.argv[2]))] * (i % 5 + 1))
+'''
+
+with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+    npaa.append(np.full((1, 3), -1))
+
+processes = [
+    subprocess.Popen([sys.executable, '-c', worker, str(tmpfile), str(i)])
+    for i in range(4)
+]
+for process in processes:
+    assert process.wait() == 0
+
+arr = np.load(tmpfile)
+rows_per_worker = sum(
+    i % 7 + 1 if i % 2 else i % 5 + 1 for i in range(50)
+)
+assert arr.shape == (1 + 4 * rows_per_worker, 3)
+assert np.all(arr == arr[:, :1])
+assert np.all(np.bincount(arr[1:, 0]) == rows_per_worker)
+assert not npy_append_array.npy_append_array.needs_recovery(tmpfile)
+
+# empty appends reserve nothing, a slot of length 0 would look released and
+# could be taken over by another process before it is
+with NpyAppendArray(tmpfile, multiprocess=True) as npaa1, \
+NpyAppendArray(tmpfile, multiprocess=True) as npaa2:
+    offset = npaa1._NpyAppendArray__reserve_range(3 * arr.itemsize)
+    npaa2.append(np.zeros((0, 3), dtype=arr.dtype))
+    npaa2.extend([np.zeros((0, 3), dtype=arr.dtype)] * 2)
+    fd = os.open(str(tmpfile) + '.reservations', os.O_RDONLY)
+    assert npy_append_array.npy_append_array._read_reservations(fd)[1] == \
+        [(offset, 3 * arr.itemsize)]
+    os.close(fd)
+    os.pwrite(npaa1.fp.fileno(), np.full(3, 7, arr.dtype).tobytes(), offset)
+    npaa1._NpyAppendArray__release_range(offset, 3 * arr.itemsize)
+assert np.array_equal(np.load(tmpfile)[-1], [7] * 3)
+arr = np.load(tmpfile)
+
+# a crashed worker leaves a gap, which recover fills with zeros
+npaa1 = NpyAppendArray(tmpfile, multiprocess=True)
+npaa1._NpyAppendArray__reserve_range(2 * 3 * arr.itemsize)
+npaa2 = NpyAppendArray(tmpfile, multiprocess=True)
+npaa2.append(np.full((1, 3), 9))
+npaa1.close()
+npaa2.close()
+
+assert np.load(tmpfile).shape == arr.shape
+assert npy_append_array.npy_append_array.needs_recovery(tmpfile)
+npy_append_array.recover(tmpfile)
+arr2 = np.load(tmpfile)
+assert np.all(arr2[:len(arr)] == arr)
+assert np.all(arr2[len(arr):] == [[0] * 3] * 2 + [[9] * 3])
+assert not os.path.exists(str(tmpfile) + '.reservations')
+
+tmpfile.unlink(missing_ok=True)
+
+# sharded datasets with a lazily memory mapped reader
+import shutil, json
+from npy_append_array import NpyAppendDataset, NpyAppendDatasetReader
+
+tmpdir = tmpfile.with_name('dataset')
+shutil.rmtree(tmpdir, ignore_errors=True)
+
+arrs = [
+    np.arange(i * 40, (i + 1) * 40).reshape(-1, 4) * (i + 1) for i in range(20)
+]
+ref = np.concatenate(arrs)
+
+with NpyAppendDataset(tmpdir, max_shard_rows=7) as dataset:
+    for arr in arrs[:10]:
+        dataset.append(arr)
+
+with NpyAppendDataset(tmpdir, max_shard_bytes=23 * 4 * 8) as dataset:
+    for arr in arrs[10:]:
+        dataset.append(arr.astype(np.int32))
+    assert dataset.shape == ref.shape
+
+reader = NpyAppendDatasetReader(tmpdir)
+assert reader.shape == ref.shape and reader.dtype == ref.dtype
+assert len(list(tmpdir.glob('shard_*.npy'))) == 19
+
+for key in [
+    0, 5, -1, len(ref) - 1, slice(None), slice(3, 150), slice(5, 190, 3),
+    slice(None, None, -4), slice(180, 2, -7), slice(50, 10), (slice(3, 30), 2),
+    (17, slice(1, 3)), [0, 199, 7, 8, -3], ref[:, 0] % 3 == 0,
+    ([0, 199, 7], 2), (ref[:, 0] % 3 == 0, slice(1, 3)), ([1, 2], [0, 3]),
+    ([[1, 2], [3, -1]], slice(None)), (np.int64(5), [1, 2]), (Ellipsis, 1),
+    (None, 4)
+]:
+    assert np.array_equal(reader[key], ref[key])
+
+assert np.array_equal(np.asarray(reader), ref)
+
+# a crash after starting a new shard, but before its first append
+manifest = json.loads((tmpdir / 'manifest.json').read_text())
+manifest['shards'].append({'filename': 'shard_000019.npy', 'rows': 0})
+(tmpdir / 'manifest.json').write_text(json.dumps(manifest))
+with NpyAppendDataset(tmpdir) as dataset:
+    assert dataset.shape == ref.shape
+    dataset.append(ref[:5])
+assert np.array_equal(
+    NpyAppendDatasetReader(tmpdir)[:], np.concatenate([ref, ref[:5]])
+)
+
+shutil.rmtree(tmpdir)
+
+# tailing a file while it is being appended to
+from npy_append_array import NpyTailReader
+
+for fortran_order, watch, buffer_bytes in product(
+    [False, True], ["header", "size"], [None, 100]
+):
+    first = np.zeros((3, 2), order='F') if fortran_order else np.zeros((2, 3))
+    axis = -1 if fortran_order else 0
+
+    with NpyAppendArray(
+        tmpfile, delete_if_exists=True, buffer_bytes=buffer_bytes
+    ) as npaa:
+        npaa.append(first)
+
+        def write():
+            for i in range(1, 200):
+                npaa.append(np.full(first.shape, i))
+
+        with NpyTailReader(tmpfile, watch=watch, poll_interval=0.001) as tail:
+            thread = threading.Thread(target=write)
+            thread.start()
+            pieces = []
+            for arr in tail.follow(timeout=0.5):
+                pieces.append(np.array(arr))
+            thread.join()
+            npaa.flush()
+            pieces.append(tail.poll())
+
+    arr = np.concatenate(pieces, axis=axis)
+    assert np.array_equal(arr, np.load(tmpfile))
+    assert arr.shape[axis] == 400
+
+# preallocated space beyond a stale header is not handed out as rows of zeros
+with NpyAppendArray(
+    tmpfile, delete_if_exists=True, preallocate=1 << 20,
+    header_policy=HeaderPolicy(every_appends=None)
+) as npaa:
+    npaa.append(np.ones((2, 3)))
+    with NpyTailReader(tmpfile, watch="size") as tail:
+        # large enough to bypass the file object's buffer
+        npaa.append(np.full((1000, 3), 2.))
+        assert tmpfile.stat().st_size > 128 + 1002 * 3 * 8
+        assert np.array_equal(tail.poll(), np.concatenate(
+            [np.ones((2, 3)), np.full((1000, 3), 2.)]
+        ))
+        # rows of zeros only show up once the header covers them
+        npaa.append(np.zeros((1, 3)))
+        npaa.append(np.full((1000, 3), 3.))
+        assert tail.poll().shape == (0, 3)
+        npaa.flush()
+        assert np.array_equal(tail.poll(), np.concatenate(
+            [np.zeros((1, 3)), np.full((1000, 3), 3.)]
+        ))
+
+tmpfile.unlink(missing_ok=True)
+
+# ragged arrays with an offsets index
+from npy_append_array import (
+    NpyAppendRaggedArray, NpyAppendRaggedArrayReader, recover_ragged
+)
+
+valuesfile = tmpfile.with_name('values.npy')
+offsetsfile = tmpfile.with_name('offsets.npy')
+records = [
+    np.arange(i % 7 * 2, dtype=np.float32).reshape(-1, 2) + i
+    for i in range(100)
+]
+
+with NpyAppendRaggedArray(
+    valuesfile, offsetsfile, delete_if_exists=True
+) as ragged:
+    for record in records[:10]:
+        ragged.append(record)
+    ragged.extend(records[10:50])
+
+with NpyAppendRaggedArray(valuesfile, offsetsfile) as ragged:
+    ragged.extend(records[50:])
+    assert len(ragged) == 100
+
+reader = NpyAppendRaggedArrayReader(valuesfile, offsetsfile)
+assert len(reader) == 100
+assert all(np.array_equal(a, b) for a, b in zip(reader, records))
+assert np.array_equal(reader[-1], records[-1])
+assert len(reader[10:20]) == 10
+del reader
+
+# crash while appending: the values of the last three records (1, 0 and 6
+# rows) are cut off or incomplete
+values_size = valuesfile.stat().st_size
+os.truncate(valuesfile, values_size - 5 * 2 * 4 - 3)
+
+try:
+    NpyAppendRaggedArray(valuesfile, offsetsfile)
+    assert False
+except ValueError:
+    pass
+
+recover_ragged(valuesfile, offsetsfile)
+reader = NpyAppendRaggedArrayReader(valuesfile, offsetsfile)
+assert len(reader) == 97
+assert all(np.array_equal(a, b) for a, b in zip(reader, records))
+assert len(reader.values) == reader.offsets[-1]
+del reader
+
+valuesfile.unlink()
+offsetsfile.unlink()
+
+# compressed chunked files
+from npy_append_array import (
+    NpyAppendCompressedArray, NpyCompressedArrayReader, compress_npy,
+    decompress_npy
+)
+
+compressedfile = tmpfile.with_name('tmp.npc')
+dtype = np.dtype([('a', np.int64), ('b', np.float32, (2,))])
+ref = np.zeros(1000, dtype=dtype)
+ref['a'] = np.arange(1000)
+ref['b'] = np.arange(2000).reshape(-1, 2) % 7
+
+for codec in ["zlib", "lzma", "bz2"]:
+    with NpyAppendCompressedArray(
+        compressedfile, delete_if_exists=True, codec=codec, chunk_rows=64,
+        max_workers=3
+    ) as npca:
+        for start in range(0, 600, 37):
+            npca.append(ref[start:min(start + 37, 600)])
+        assert npca.shape == (600,)
+
+    # reopening overwrites the chunk index with new chunks
+    with NpyAppendCompressedArray(compressedfile) as npca:
+        npca.append(ref[600:])
+
+    with NpyCompressedArrayReader(compressedfile, cache_chunks=2) as reader:
+        assert reader.shape == ref.shape and reader.dtype == dtype
+        for key in [
+            0, -1, 63, 64, slice(None), slice(60, 70), slice(5, 990, 13),
+            slice(None, None, -3), slice(30, 10), [3, 999, 64, 63],
+            ref['a'] % 5 == 0, (slice(10, 20), )
+        ]:
+            assert np.array_equal(reader[key], ref[key])
+
+# a crash leaves neither the index nor the last chunk complete
+with NpyAppendCompressedArray(
+    compressedfile, delete_if_exists=True, chunk_rows=100
+) as npca:
+    npca.append(ref)
+    npca.flush()
+    shutil.copy(compressedfile, tmpfile)
+
+os.truncate(tmpfile, tmpfile.stat().st_size - 10)
+with NpyCompressedArrayReader(tmpfile) as reader:
+    assert len(reader) == 900
+with NpyAppendCompressedArray(tmpfile) as npca:
+    npca.append(ref[-100:])
+with NpyCompressedArrayReader(tmpfile) as reader:
+    assert np.array_equal(reader[:], ref)
+
+# a buffer reused by the caller does not change rows not yet compressed
+buf = np.empty(10, dtype=np.int64)
+with NpyAppendCompressedArray(
+    compressedfile, delete_if_exists=True, chunk_rows=64
+) as npca:
+    for i in range(20):
+        buf[...] = i
+        npca.append(buf)
+with NpyCompressedArrayReader(compressedfile) as reader:
+    assert np.array_equal(reader[:], np.repeat(np.arange(20), 10))
+
+# tuple keys on arrays with more than one axis
+ref2 = np.arange(600).reshape(200, 3)
+with NpyAppendCompressedArray(
+    compressedfile, delete_if_exists=True, chunk_rows=64
+) as npca:
+    npca.append(ref2)
+with NpyCompressedArrayReader(compressedfile) as reader:
+    for key in [
+        (slice(3, 130), 2), (17, slice(1, 3)), ([0, 199, 7], 2),
+        (ref2[:, 0] % 3 == 0, slice(1, 3)), ([1, 2], [0, 2]),
+        ([[1, 2], [3, -1]], slice(None)), (Ellipsis, 1)
+    ]:
+        assert np.array_equal(reader[key], ref2[key])
+
+# conversion from and to .npy
+np.save(tmpfile, ref)
+compress_npy(tmpfile, compressedfile, chunk_rows=99)
+decompress_npy(compressedfile, tmpfile.with_name('tmp2.npy'))
+assert np.array_equal(np.load(tmpfile.with_name('tmp2.npy')), ref)
+
+tmpfile.with_name('tmp2.npy').unlink()
+compressedfile.unlink()
+tmpfile.unlink()
+
+# command line checks and repairs of whole directories
+import json
+clidir = tmpfile.with_name('cli')
+shutil.rmtree(clidir, ignore_errors=True)
+(clidir / 'sub').mkdir(parents=True)
+
+with NpyAppendArray(clidir / 'ok.npy') as npaa:
+    npaa.append(np.ones((10, 3)))
+with NpyAppendArray(clidir / 'sub' / 'crashed.npy') as npaa:
+    npaa.append(np.ones((10, 3)))
+with open(clidir / 'sub' / 'crashed.npy', 'ab') as fp:
+    fp.write(np.ones((2, 3)).tobytes()[:-4])
+np.save(clidir / 'legacy.npy', np.ones((10, 3)), allow_pickle=False)
+(clidir / 'broken.npy').write_bytes(b'not an npy file')
+(clidir / 'ignored.txt').write_bytes(b'')
+
+def run_cli(*args):
+    result = subprocess.run(
+        [sys.executable, '-m', 'npy_append_array', *args, str(clidir)],
+        capture_output=True, text=True
+    )
+    return result.returncode, {
+        Path(report['filename']).name: report
+        for report in map(json.loads, result.stdout.splitlines())
+    }
+
+returncode, reports = run_cli('check')
+assert returncode == 1
+assert sorted(reports) == ['broken.npy', 'crashed.npy', 'legacy.npy', 'ok.npy']
+assert 'error' in reports['broken.npy']
+assert not reports['ok.npy']['needs_recovery']
+assert not reports['ok.npy']['preallocated']
+assert reports['crashed.npy']['needs_recovery']
+assert reports['crashed.npy']['shape'] == [10, 3]
+
+for args in [('--dry-run',), ('--processes', '-j', '2')]:
+    legacy_appendable = npy_append_array.is_appendable(clidir / 'legacy.npy')
+    returncode, reports = run_cli('ensure-appendable', *args)
+    assert reports['ok.npy']['action'] is None
+    assert npy_append_array.is_appendable(clidir / 'legacy.npy') == \
+        (legacy_appendable or '--dry-run' not in args)
+
+returncode, reports = run_cli('recover', '--dry-run')
+assert reports['crashed.npy']['action'] == 'recover'
+assert np.load(clidir / 'sub' / 'crashed.npy').shape == (10, 3)
+
+returncode, reports = run_cli('recover', '--zerofill-incomplete')
+assert reports['crashed.npy']['action'] == 'recover'
+assert np.load(clidir / 'sub' / 'crashed.npy').shape == (12, 3)
+returncode, reports = run_cli('check', '--pattern', '*.npy')
+assert not any(
+    report.get('needs_recovery') for report in reports.values()
+)
+
+shutil.rmtree(clidir)
+
+# counters, timing histograms and callbacks
+from npy_append_array import AppendStats
+
+events = []
+stats = AppendStats(callbacks=[lambda event, value: events.append(event)])
+arr = np.arange(300, dtype=np.float32).reshape(100, 3)
+
+with NpyAppendArray(
+    tmpfile, delete_if_exists=True, stats=stats,
+    header_policy=HeaderPolicy(every_appends=2, sync="fsync")
+) as npaa:
+    assert npaa.stats is stats
+    npaa.append(arr)
+    npaa.append(arr.astype(np.float64))
+    npaa.extend([arr, arr])
+    npaa.reserve(10)[...] = 0
+
+snapshot = stats.snapshot()
+assert snapshot["appends"] == 5
+assert snapshot["bytes_appended"] == 4 * arr.nbytes + 10 * 3 * 4
+# due after the extend, and on close
+assert snapshot["header_rewrites"] == 2
+assert snapshot["syncs"] >= 1
+assert snapshot["timings"]["convert"]["count"] == 3
+assert snapshot["timings"]["write"]["count"] == 2
+assert snapshot["timings"]["lock_wait"]["count"] >= 4
+assert sum(count for _, count in snapshot["append_bytes"]["buckets"]) == 5
+assert events.count("append") == 5 and "sync" in events
+json.dumps(snapshot)
+
+stats.reset()
+assert stats.snapshot()["appends"] == 0
+
+# conversions are done block by block, with bounded extra memory
+import tracemalloc
+arr = np.arange(4 * 1024**2, dtype=np.float64).reshape(-1, 64)
+
+# also converted in parallel, ahead of the writes
+for convert_bytes, convert_workers in [
+    (None, 2), (256 * 1024, 0), (256 * 1024, 4)
+]:
+    for fortran_order in [False, True]:
+        with NpyAppendArray(
+            tmpfile, delete_if_exists=True, convert_bytes=convert_bytes,
+            convert_workers=convert_workers, stats=AppendStats()
+        ) as npaa:
+            npaa.append(np.zeros((64, 2) if fortran_order else (2, 64),
+                dtype=np.float32, order='F' if fortran_order else 'C'))
+            tracemalloc.start()
+            npaa.append(arr.T if fortran_order else arr)
+            npaa.extend([arr[:1000].T, arr[5:10].T] if fortran_order
+                else [arr[:1000], arr[5:10]])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            chunk_count = npaa.stats.snapshot()["timings"]["convert"]["count"]
+
+        expected = np.concatenate(
+            [np.zeros((64, 2)), arr.T, arr[:1000].T, arr[5:10].T], -1
+        ) if fortran_order else np.concatenate(
+            [np.zeros((2, 64)), arr, arr[:1000], arr[5:10]]
+        )
+        assert np.array_equal(np.load(tmpfile), expected.astype(np.float32))
+
+        if convert_bytes is None:
+            assert peak >= arr.nbytes // 2 and chunk_count == 3
+        else:
+            assert peak < (convert_workers + 4) * convert_bytes
+            assert chunk_count > 16
+
+# streams of arrays, raw bytes and file objects
+def rows(start, stop):
+    for i in range(start, stop):
+        yield np.full(3, i, dtype=np.int64) if i % 2 else \
+            np.full((1, 3), i, dtype=np.int32)
+
+with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+    try:
+        npaa.append_bytes(b'')
+        assert False
+    except ValueError:
+        pass
+    assert npaa.append_stream(rows(0, 1000), chunk_rows=64) == 1000
+    npaa.append_bytes(np.arange(1000, 1010, dtype=np.int32).repeat(3))
+    npaa.append_bytes(bytearray(12))
+    for data in [b'\0' * 10, np.zeros(2, np.int64)]:
+        try:
+            npaa.append_bytes(data)
+            assert False
+        except ValueError:
+            pass
+
+    # a pipe delivers data in pieces which do not align with rows
+    data = np.arange(2000, 7000, dtype=np.int32).repeat(3).tobytes()
+    read_fd, write_fd = os.pipe()
+    def produce():
+        with open(write_fd, 'wb', buffering=0) as fp:
+            for start in range(0, len(data), 1001):
+                fp.write(data[start:start + 1001])
+    producer = threading.Thread(target=produce)
+    producer.start()
+    with open(read_fd, 'rb', buffering=0) as fp:
+        assert npaa.append_from_file(fp, chunk_bytes=4096) == 5000
+    producer.join()
+
+    try:
+        npaa.append_from_file(io.BytesIO(bytes(30)))
+        assert False
+    except ValueError:
+        pass
+
+expected = np.concatenate([
+    np.arange(1010), [0], np.arange(2000, 7000), [0, 0]
+]).astype(np.int32).repeat(3).reshape(-1, 3)
+assert np.array_equal(np.load(tmpfile), expected)
+
+# generators may reuse one buffer, like when reading from a socket
+def reused(count, shape, order):
+    buf = np.empty(shape, dtype=np.int32, order=order)
+    for i in range(count):
+        buf[...] = i
+        yield buf
+
+for fortran_order in [False, True]:
+    shape, order = ((3, 2), 'F') if fortran_order else ((2, 3), 'C')
+    axis = -1 if fortran_order else 0
+    with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+        assert npaa.append_stream(reused(100, shape, order), chunk_rows=7) == 200
+        npaa.append_stream([np.full(shape, 100, order=order)] * 2, chunk_rows=1)
+    assert np.array_equal(np.load(tmpfile), np.concatenate(
+        [np.full(shape, i, order=order) for i in [*range(101), 100]], axis
+    ))
+
+# in Fortran order, raw rows are along the last axis
+with NpyAppendArray(tmpfile, delete_if_exists=True) as npaa:
+    npaa.append(np.zeros((2, 2), order='F', dtype=np.uint8))
+    npaa.append_bytes(b'\1\2\3\4')
+    npaa.append_from_file(io.BytesIO(b'\5\6'))
+assert np.array_equal(np.load(tmpfile), [[0, 0, 1, 3, 5], [0, 0, 2, 4, 6]])
+
+# a pool of many files, of which only a few are open at a time
+from npy_append_array import NpyAppendArrayPool
+pooldir = tmpfile.with_name('pool')
+shutil.rmtree(pooldir, ignore_errors=True)
+pooldir.mkdir()
+
+filenames = [pooldir / '{}.npy'.format(i) for i in range(50)]
+(pooldir / '0.npy').write_bytes(b'to be deleted')
+rng = np.random.default_rng(0)
+expected = {filename: [] for filename in filenames}
+header_reads = []
+header_info = npy_append_array.npy_append_array._HeaderInfo
+npy_append_array.npy_append_array._HeaderInfo = \
+    lambda fp: header_reads.append(fp.name) or header_info(fp)
+
+def open_fd_count():
+    return len(os.listdir('/proc/self/fd')) if os.path.exists('/proc/self/fd') \
+        else 0
+
+fd_count = open_fd_count()
+with NpyAppendArrayPool(max_open=8, delete_if_exists=True) as pool:
+    for i in range(2000):
+        filename = filenames[rng.integers(len(filenames))]
+        arr = np.full((int(rng.integers(1, 4)), 2), i)
+        if i % 2:
+            pool.append(filename, arr)
+        else:
+            pool.extend(filename, [arr[:1], arr[1:]])
+        expected[filename].append(arr)
+        assert len(pool) <= 8
+        assert open_fd_count() <= fd_count + 8
+
+    # threads appending to the same few files, which must stay open
+    def task(i):
+        for j in range(100):
+            pool.append(filenames[(i + j) % 12], np.full((1, 2), -1 - i))
+    threads = [threading.Thread(target=task, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+npy_append_array.npy_append_array._HeaderInfo = header_info
+
+# headers are only read when a file is first created by the pool
+assert len(header_reads) == len(set(header_reads))
+for filename in filenames:
+    arr = np.load(filename)
+    own = np.concatenate(expected[filename]) if expected[filename] else \
+        np.empty((0, 2))
+    assert np.array_equal(arr[arr[:, 0] >= 0], own)
+
+# outside the pool, the size no longer matches and the header is read again
+with NpyAppendArray(filenames[1]) as npaa:
+    header = npaa.header
+    assert header is None
+    npaa.append(np.zeros((1, 2), dtype=np.int64))
+header = npaa.header
+assert header[0][0] == len(np.load(filenames[1]))
+with open(filenames[1], 'ab') as fp:
+    fp.write(bytes(16))
+try:
+    NpyAppendArray(filenames[1], header=header)
+    assert False
+except ValueError:
+    pass
+
+shutil.rmtree(pooldir)
+
+# tables with one file per column, kept aligned through crashes
+from npy_append_array import (
+    NpyAppendTable, NpyAppendTableReader, recover_table
+)
+tabledir = tmpfile.with_name('table')
+shutil.rmtree(tabledir, ignore_errors=True)
+
+records = np.zeros(100, dtype=[('id', '<i8'), ('pos', '<f4', (3,)), ('tag', 'S2')])
+records['id'] = np.arange(100)
+records['pos'] = np.arange(300).reshape(100, 3)
+records['tag'] = b'ab'
+
+with NpyAppendTable(tabledir, header_policy=HeaderPolicy(every_appends=4)) as table:
+    table.append(records[:10])
+    assert table.columns == ['id', 'pos', 'tag'] and len(table) == 10
+    for start in range(10, 100, 10):
+        table.append({
+            name: records[name][start:start + 10]
+            for name in ['tag', 'pos', 'id']
+        })
+    for batch in [
+        {'id': records['id'][:2], 'pos': records['pos'][:2]},
+        {'id': records['id'][:2], 'pos': records['pos'][:3], 'tag': records['tag'][:2]},
+        {'id': records['id'][:2], 'pos': np.zeros((2, 4)), 'tag': records['tag'][:2]},
+    ]:
+        try:
+            table.append(batch)
+            assert False
+        except ValueError:
+            pass
+
+reader = NpyAppendTableReader(tabledir)
+assert len(reader) == 100 and 'pos' in reader
+assert np.array_equal(reader['pos'], records['pos'])
+columns = reader[['id', 'tag']]
+assert np.array_equal(columns['id'], records['id'])
+assert np.array_equal(columns['tag'], records['tag'])
+
+# a crash after writing the data of some columns, but before their headers
+with open(tabledir / 'id.npy', 'ab') as fp:
+    fp.write(np.arange(100, 105, dtype='<i8').tobytes())
+with open(tabledir / 'pos.npy', 'ab') as fp:
+    fp.write(np.zeros(3 * 3 + 1, dtype='<f4').tobytes())
+try:
+    NpyAppendTable(tabledir)
+    assert False
+except ValueError:
+    pass
+
+assert len(NpyAppendTableReader(tabledir)) == 100
+recover_table(tabledir)
+with NpyAppendTable(tabledir) as table:
+    assert len(table) == 100
+    table.append(records[:5])
+
+reader = NpyAppendTableReader(tabledir)
+assert len(reader) == 105
+assert np.array_equal(reader['id'], np.concatenate([records['id'], records['id'][:5]]))
+
+with NpyAppendTable(tabledir, delete_if_exists=True) as table:
+    assert len(table) == 0 and not table.columns
+    table.append({'x': np.arange(3)})
+assert NpyAppendTableReader(tabledir).columns == ['x']
+
+# a column that cannot be converted leaves all columns unchanged
+with NpyAppendTable(tabledir, delete_if_exists=True) as table:
+    table.append({'a': [10], 'b': [1.5]})
+    try:
+        table.append({'b': [2.5], 'a': ['x']})
+        assert False
+    except ValueError:
+        pass
+    table.append({'a': [20], 'b': [3.5]})
+reader = NpyAppendTableReader(tabledir)
+assert np.array_equal(reader['a'], [10, 20])
+assert np.array_equal(reader['b'], [1.5, 3.5])
+
+shutil.rmtree(tabledir)
+
+# reading rows back while the file is still open for appending
+for fortran_order, buffer_bytes, preallocate in [
+    (False, None, None), (True, None, None), (False, 4096, None),
+    (False, None, 1024**2)
+]:
+    arr = np.arange(60, dtype=np.float64).reshape(20, 3)
+    arr = np.asfortranarray(arr.T) if fortran_order else arr
+    with NpyAppendArray(
+        tmpfile, delete_if_exists=True, buffer_bytes=buffer_bytes,
+        preallocate=preallocate
+    ) as npaa:
+        assert len(npaa) == 0 and npaa
+        try:
+            npaa.view()
+            assert False
+        except ValueError:
+            pass
+        views = []
+        for i in range(50):
+            npaa.append(arr + i)
+            views.append(npaa.view())
+            assert len(npaa) == 20 * (i + 1)
+            # rows come first, also in Fortran order
+            last = npaa[-20:]
+            assert np.array_equal(
+                last, np.moveaxis(arr + i, -1, 0) if fortran_order else arr + i
+            )
+            assert not last.flags.writeable
+            assert np.array_equal(npaa[len(npaa) - 1], last[-1])
+            assert np.array_equal(npaa[-1, 0], last[-1, 0])
+        assert len(list(npaa)) == len(npaa)
+        whole = npaa.view()
+        # views keep their map alive and stay valid while the file grows
+        assert np.array_equal(views[0], arr)
+        assert np.shares_memory(views[-1], whole)
+    assert np.array_equal(whole, np.load(tmpfile))
+
+# undoing appends with checkpoint, rollback and truncate
+for fortran_order, buffer_bytes, with_view, sync in product(
+    [False, True], [None, 1024], [False, True], [None, "fdatasync"]
+):
+    arr = np.arange(30, dtype=np.int16).reshape(10, 3)
+    arr = np.asfortranarray(arr.T) if fortran_order else arr
+    batches = [arr + 100 * i for i in range(10)]
+    concatenate = lambda arrs: np.concatenate(arrs, -1 if fortran_order else 0)
+
+    with NpyAppendArray(
+        tmpfile, delete_if_exists=True, buffer_bytes=buffer_bytes,
+        header_policy=HeaderPolicy(sync=sync)
+    ) as npaa:
+        assert npaa.checkpoint() == 0
+        npaa.extend(batches[:5])
+        token = npaa.checkpoint()
+        assert token == 50
+        if with_view:
+            before = npaa.view()
+        npaa.extend(batches[5:])
+        npaa.rollback(token)
+        assert np.array_equal(np.load(tmpfile), concatenate(batches[:5]))
+        if not with_view:
+            assert tmpfile.stat().st_size == \
+                128 + 50 * 3 * 2
+        else:
+            assert np.array_equal(before, concatenate(batches[:5]))
+        for count in [-1, 51]:
+            try:
+                npaa.truncate(count)
+                assert False
+            except ValueError:
+                pass
+        npaa.append(batches[9])
+        npaa.truncate(55)
+        assert len(npaa) == 55
+        npaa.append(batches[8])
+    assert np.array_equal(np.load(tmpfile), concatenate(
+        [*batches[:5], batches[9][..., :5] if fortran_order
+            else batches[9][:5], batches[8]]
+    ))
+    assert not npy_append_array.npy_append_array.needs_recovery(tmpfile)
+
+# views stay valid after truncate and close, the file is not cut below them
+for preallocate in [None, 1 << 20]:
+    with NpyAppendArray(
+        tmpfile, delete_if_exists=True, preallocate=preallocate
+    ) as npaa:
+        npaa.append(np.ones((1000, 4)))
+        view = npaa.view()
+        reserved = npaa.reserve(1000)
+        reserved[...] = 2
+        npaa.truncate(10)
+    assert view[-1].sum() == 0 and reserved[-1].sum() == 0
+    assert np.array_equal(np.load(tmpfile), np.ones((10, 4)))
+    del view, reserved
+
+    # without views, slack is trimmed as before
+    with NpyAppendArray(
+        tmpfile, delete_if_exists=True, preallocate=preallocate
+    ) as npaa:
+        npaa.append(np.ones((1000, 4)))
+        npaa.view()
+        npaa.reserve(1000)
+        npaa.truncate(10)
+    assert tmpfile.stat().st_size == 128 + 10 * 4 * 8
+
+# concatenating files into one appendable file
+from npy_append_array import concatenate_files
+catdir = tmpfile.with_name('concatenate')
+shutil.rmtree(catdir, ignore_errors=True)
+catdir.mkdir()
+outfile = catdir / 'out.npy'
+
+for fortran_order in [False, True]:
+    # a single column would be C and Fortran contiguous at the same time
+    parts = [
+        np.arange(i * 100, i * 100 + 3 * i, dtype='<f4').reshape(i, 3)
+        for i in range(2, 10)
+    ]
+    if fortran_order:
+        parts = [np.asfortranarray(part.T) for part in parts]
+    filenames = [catdir / '{}.npy'.format(i) for i in range(len(parts))]
+    for filename, part in zip(filenames, parts):
+        np.save(filename, part)
+
+    # data beyond the header, e.g. preallocated space, is not copied
+    with NpyAppendArray(filenames[1], preallocate=1024**2) as npaa:
+        npaa.append(parts[1])
+        shutil.copy(filenames[1], catdir / 'preallocated.npy')
+    filenames[1] = catdir / 'preallocated.npy'
+    parts[1] = np.concatenate([parts[1]] * 2, -1 if fortran_order else 0)
+
+    for max_workers in [1, 4]:
+        shape = concatenate_files(outfile, filenames, max_workers=max_workers)
+        expected = np.concatenate(parts, -1 if fortran_order else 0)
+        assert shape == expected.shape
+        assert np.array_equal(np.load(outfile), expected)
+        assert npy_append_array.is_appendable(outfile)
+
+    with NpyAppendArray(outfile) as npaa:
+        npaa.append(parts[2])
+
+np.save(catdir / 'other_dtype.npy', np.zeros((2, 3), dtype='<f8'))
+np.save(catdir / 'other_shape.npy', np.zeros((2, 4), dtype='<f4'))
+np.save(catdir / 'object.npy', np.array([[None]]), allow_pickle=True)
+np.save(catdir / 'ok.npy', np.zeros((2, 3), dtype='<f4'))
+mtime = outfile.stat().st_mtime_ns
+for inputs in [
+    [], ['ok.npy', 'other_dtype.npy'], ['ok.npy', 'other_shape.npy'],
+    ['object.npy'], ['ok.npy', 'out.npy']
+]:
+    try:
+        concatenate_files(outfile, [catdir / name for name in inputs])
+        assert False
+    except ValueError:
+        pass
+assert outfile.stat().st_mtime_ns == mtime
+assert sorted(p.name for p in catdir.iterdir() if p.name.startswith('out'))\
+    == ['out.npy']
+
+shutil.rmtree(catdir)